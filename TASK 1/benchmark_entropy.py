@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import numpy as np
+from codecs_huffman import BACKENDS
+from frame_store import load_frames
+
+# the coders that are measured: (backend, whether the runs of zeros are replaced first)
+CONFIGURATIONS = [("huffman", False), ("huffman", True), ("rans", False), ("rans", True)]
+
+def shannon_entropy(array):
+    """
+    Function that returns the Shannon entropy of the values of the array, in bits per value.
+    """
+    values = np.asarray(array).ravel()
+    if values.size == 0:
+        return 0.0
+
+    frequency = np.bincount(values.astype(np.int64) - int(values.min()))
+    probabilities = frequency[frequency > 0] / values.size
+
+    # adding 0.0 turns the -0.0 of a constant frame into 0.0
+    return float(-np.sum(probabilities * np.log2(probabilities))) + 0.0
+
+def synthetic_cases(shape, seed=0):
+    """
+    Function that creates frames with known distributions: uniform pixels, Laplacian residuals
+    and residuals that are mostly zero.
+    """
+    rng = np.random.default_rng(seed)
+
+    uniform = rng.integers(0, 256, shape).astype(np.uint8)
+    laplacian = np.clip(np.round(rng.laplace(0, 2, shape)), -255, 255).astype(np.int16)
+    mostly_zero = np.where(rng.random(shape) < 0.95, 0, laplacian).astype(np.int16)
+
+    return {"uniform": uniform, "laplacian": laplacian, "mostly_zero": mostly_zero}
+
+def error_frame_cases(folder, limit):
+    """
+    Function that reads up to `limit` of the error frames saved by frames.py, from their store or folder.
+    """
+    frames = load_frames(folder)[:limit]
+
+    return {"error_frame" + str(i): frames[i] for i in range(len(frames))}
+
+def time_best(function, repeat):
+    """
+    Function that calls the function `repeat` times and returns its last result and the fastest time.
+    """
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return result, best
+
+def peak_memory(function):
+    """
+    Function that calls the function once more while tracing the allocations and returns the peak memory in bytes.
+    It is a separate run, as tracing the allocations slows everything down.
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+def measure(backend, zero_runs, array, repeat):
+    """
+    Function that encodes and decodes the array with the given backend and returns the measurements.
+    """
+    coder = BACKENDS[backend]
+
+    data, encode_time = time_best(lambda: coder().encode_container(array, zero_runs=zero_runs), repeat)
+    decoded, decode_time = time_best(lambda: coder().decode_container(data), repeat)
+
+    peak = peak_memory(lambda: coder().decode_container(coder().encode_container(array, zero_runs=zero_runs)))
+
+    megabytes = array.nbytes / 1e6
+
+    return {
+        "backend": backend,
+        "zero_runs": zero_runs,
+        "values": int(array.size),
+        "raw_bytes": int(array.nbytes),
+        "encoded_bytes": len(data),
+        "bits_per_symbol": 8 * len(data) / max(array.size, 1),
+        "entropy": shannon_entropy(array),
+        "encode_mb_per_s": megabytes / encode_time if encode_time > 0 else None,
+        "decode_mb_per_s": megabytes / decode_time if decode_time > 0 else None,
+        "peak_memory_bytes": int(peak),
+        "lossless": bool(np.array_equal(decoded, array)),
+    }
+
+def run_benchmark(cases, repeat=3, configurations=CONFIGURATIONS):
+    """
+    Function that measures every configuration on every case and returns a list of results.
+    """
+    results = []
+
+    for name, array in cases.items():
+        for backend, zero_runs in configurations:
+            result = measure(backend, zero_runs, array, repeat)
+            result["case"] = name
+            results.append(result)
+
+            print("{:<14} {:<8} {:<5} {:>7.3f} bits/symbol (entropy {:.3f})  encode {:>7.1f} MB/s  decode {:>7.1f} MB/s"
+                  .format(name, backend, "rle" if zero_runs else "", result["bits_per_symbol"], result["entropy"],
+                          result["encode_mb_per_s"] or 0, result["decode_mb_per_s"] or 0))
+
+    return results
+
+def main(argv=None):
+    """
+    Main function, with the arguments of the command line (argv, by default those of the process).
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the entropy coders.")
+    parser.add_argument("--frames", default="huffman_encoding/error_frames", help="store or folder of the error frames")
+    parser.add_argument("--limit", type=int, default=4, help="number of error frames to use")
+    parser.add_argument("--height", type=int, default=720, help="height of the synthetic frames")
+    parser.add_argument("--width", type=int, default=1280, help="width of the synthetic frames")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions, the fastest one is kept")
+    parser.add_argument("--output", default="benchmark_entropy.json", help="where to write the results")
+    args = parser.parse_args(argv)
+
+    cases = synthetic_cases((args.height, args.width))
+    if os.path.exists(args.frames):
+        cases.update(error_frame_cases(args.frames, args.limit))
+
+    results = run_benchmark(cases, args.repeat)
+
+    with open(args.output, "w") as output:
+        json.dump({"repeat": args.repeat, "results": results}, output, indent=2)
+
+    print("Results written in " + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import sys
+import cv2
+import numpy as np
+from benchmark_entropy import time_best, peak_memory
+from motion_compensation import estimate_motion, partition_motion, predict_from_field, predict_from_vectors
+
+# the motion searches that are measured: (name, options of estimate_motion, or None for partition_motion)
+CONFIGURATIONS = [
+    ("fixed", {"strategy": "fixed"}),
+    ("full", {"strategy": "full"}),
+    ("three_step", {"strategy": "three_step"}),
+    ("diamond", {"strategy": "diamond"}),
+    ("hexagon", {"strategy": "hexagon"}),
+    ("three_step_predictive", {"strategy": "three_step", "predictive": True}),
+    ("full_predictive", {"strategy": "full", "predictive": True}),
+    ("three_step_pyramid", {"strategy": "three_step", "levels": 2}),
+    ("partition", None),
+]
+
+RESOLUTIONS = [(360, 640), (720, 1280), (1080, 1920), (2160, 3840)]
+
+def parse_resolutions(text):
+    """
+    Function that reads resolutions written as WIDTHxHEIGHT, separated by commas - returns (height, width) pairs.
+    """
+    resolutions = []
+    for item in text.split(","):
+        width, height = item.lower().split("x")
+        resolutions.append((int(height), int(width)))
+
+    return resolutions
+
+def synthetic_sequence(shape, search_range=7, noise=2.0, moving=0.2, block_size=16, seed=0, pan=True):
+    """
+    Function that creates a reference frame and a target frame whose macroblocks are translated by known vectors:
+    a global motion shared by every block (none without pan, for a still scene), and a random motion of its own
+    for a share (moving) of the blocks, all within search_range and inside the frame. Gaussian noise of standard deviation noise is added to the target.
+    Returns the reference, the target and the true vectors, as (dy, dx) with target[y, x] = reference[y + dy, x + dx].
+    """
+    rng = np.random.default_rng(seed)
+    height, width = shape
+
+    # a smooth texture, so that the SAD has a clear minimum at the true vector
+    texture = rng.integers(0, 256, (height, width)).astype(np.uint8)
+    reference = cv2.normalize(cv2.GaussianBlur(texture, (0, 0), 2), None, 0, 255, cv2.NORM_MINMAX)
+
+    vertical_mblocks, horizontal_mblocks = height // block_size, width // block_size
+    ys, xs = np.meshgrid(np.arange(vertical_mblocks) * block_size, np.arange(horizontal_mblocks) * block_size,
+                         indexing="ij")
+
+    vectors = np.zeros((vertical_mblocks, horizontal_mblocks, 2), dtype=np.int64)
+    if pan:
+        vectors[:] = rng.integers(-search_range // 2, search_range // 2 + 1, 2)
+    moving_blocks = rng.random((vertical_mblocks, horizontal_mblocks)) < moving
+    vectors[moving_blocks] = rng.integers(-search_range, search_range + 1, (int(moving_blocks.sum()), 2))
+
+    vectors = np.clip(vectors, -search_range, search_range)
+    vectors[..., 0] = np.clip(vectors[..., 0], -ys, height - block_size - ys)
+    vectors[..., 1] = np.clip(vectors[..., 1], -xs, width - block_size - xs)
+
+    target = predict_from_vectors(reference, vectors, block_size).astype(np.float64)
+    target += rng.normal(0, noise, shape)
+
+    return reference, np.clip(np.round(target), 0, 255).astype(np.uint8), vectors
+
+def video_cases(path, limit):
+    """
+    Function that reads up to `limit` pairs of consecutive grayscale frames of the video - there are no true vectors.
+    """
+    capture = cv2.VideoCapture(path)
+
+    frames = []
+    while len(frames) < limit + 1:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    capture.release()
+
+    return {"video" + str(i): (frames[i], frames[i + 1], None) for i in range(len(frames) - 1)}
+
+def search(options, reference, target, search_range):
+    """
+    Function that runs one configuration - returns the vectors of the 16x16 macroblocks, the predicted frame
+    and the number of SAD evaluations.
+    """
+    if options is not None:
+        vectors, sads, evaluations = estimate_motion(reference, target, search_range=search_range, **options)
+
+        return vectors, predict_from_vectors(reference, vectors), evaluations
+
+    sizes, field, evaluations = partition_motion(reference, target, search_range)
+    # the vector of the top left 4x4 tile of every macroblock stands for the macroblock, and the 4x4 SADs are
+    # counted as sixteenths of a macroblock SAD
+    return field[::4, ::4], predict_from_field(reference, field), evaluations / 16
+
+def measure(options, reference, target, true_vectors, search_range, repeat):
+    """
+    Function that runs the configuration on a pair of frames and returns the measurements.
+    """
+    (vectors, predicted, evaluations), search_time = time_best(lambda: search(options, reference, target,
+                                                                              search_range), repeat)
+
+    peak = peak_memory(lambda: search(options, reference, target, search_range))
+
+    height, width = target.shape
+    blocks = (height // 16) * (width // 16)
+    covered = (slice(0, height // 16 * 16), slice(0, width // 16 * 16))
+    residual = target[covered].astype(np.int32) - predicted[covered]
+
+    result = {
+        "height": height,
+        "width": width,
+        "blocks": blocks,
+        "blocks_per_s": blocks / search_time if search_time > 0 else None,
+        "sad_evaluations_per_block": evaluations / blocks,
+        "residual_energy": float(np.mean(residual.astype(np.float64) ** 2)),
+        "peak_memory_bytes": int(peak),
+        "accuracy": None,
+        "mean_vector_error": None,
+    }
+
+    if true_vectors is not None:
+        vectors = vectors[:true_vectors.shape[0], :true_vectors.shape[1]]
+        result["accuracy"] = float(np.mean(np.all(vectors == true_vectors, axis=-1)))
+        result["mean_vector_error"] = float(np.mean(np.linalg.norm(vectors - true_vectors, axis=-1)))
+
+    return result
+
+def run_benchmark(cases, search_range=7, repeat=3, configurations=CONFIGURATIONS):
+    """
+    Function that measures every configuration on every case and returns a list of results.
+    """
+    results = []
+
+    for name, (reference, target, true_vectors) in cases.items():
+        for method, options in configurations:
+            result = measure(options, reference, target, true_vectors, search_range, repeat)
+            result["case"] = name
+            result["method"] = method
+            results.append(result)
+
+            accuracy = "{:6.1%}".format(result["accuracy"]) if result["accuracy"] is not None else "     -"
+            print("{:<16} {:<22} {:>10.0f} blocks/s {:>7.1f} SADs/block  accuracy {}  residual {:>8.2f}  {:>6.1f} MB"
+                  .format(name, method, result["blocks_per_s"] or 0, result["sad_evaluations_per_block"], accuracy,
+                          result["residual_energy"], result["peak_memory_bytes"] / 1e6))
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Function that compares the results with those of a baseline run - returns the list of regressions:
+    configurations at least `tolerance` (a fraction) slower or less accurate than in the baseline.
+    """
+    previous = {(result["case"], result["method"]): result for result in baseline["results"]}
+
+    regressions = []
+    for result in results:
+        old = previous.get((result["case"], result["method"]))
+        if old is None:
+            continue
+
+        name = result["case"] + " " + result["method"]
+        if old["blocks_per_s"] and result["blocks_per_s"] < old["blocks_per_s"] * (1 - tolerance):
+            regressions.append(name + ": " + "{:.0f} -> {:.0f} blocks/s".format(old["blocks_per_s"],
+                                                                                result["blocks_per_s"]))
+        if old["accuracy"] is not None and result["accuracy"] < old["accuracy"] - tolerance:
+            regressions.append(name + ": " + "accuracy {:.1%} -> {:.1%}".format(old["accuracy"], result["accuracy"]))
+
+    return regressions
+
+def main(argv=None):
+    """
+    Main function, with the arguments of the command line (argv, by default those of the process).
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the motion searches.")
+    parser.add_argument("--resolutions", type=parse_resolutions, default=RESOLUTIONS,
+                        help="synthetic resolutions as WIDTHxHEIGHT separated by commas (default up to 3840x2160)")
+    parser.add_argument("--search-range", type=int, default=7, help="search range of the motion searches")
+    parser.add_argument("--noise", type=float, default=2.0, help="standard deviation of the noise of the targets")
+    parser.add_argument("--video", default="grayscale.mp4", help="video whose frames are measured too")
+    parser.add_argument("--limit", type=int, default=2, help="number of pairs of video frames to use")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions, the fastest one is kept")
+    parser.add_argument("--output", default="benchmark_motion.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results of an earlier run - exits with an error on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown or accuracy loss")
+    args = parser.parse_args(argv)
+
+    cases = {}
+    for height, width in args.resolutions:
+        reference, target, vectors = synthetic_sequence((height, width), args.search_range, args.noise)
+        cases["synthetic" + str(width) + "x" + str(height)] = (reference, target, vectors)
+        # a mostly still scene, where the predictive searches stop early for most blocks
+        reference, target, vectors = synthetic_sequence((height, width), args.search_range, args.noise, 0.05,
+                                                        pan=False)
+        cases["still" + str(width) + "x" + str(height)] = (reference, target, vectors)
+    if os.path.isfile(args.video):
+        cases.update(video_cases(args.video, args.limit))
+
+    results = run_benchmark(cases, args.search_range, args.repeat)
+
+    with open(args.output, "w") as output:
+        json.dump({"repeat": args.repeat, "search_range": args.search_range, "noise": args.noise,
+                   "results": results}, output, indent=2)
+
+    print("Results written in " + args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import os
+import sys
+import time
+
+# the modules of a command are only imported when the command runs, so that starting the program costs nothing
+# and many short jobs can be run one after the other
+
+# the car removal lives next to this folder
+TASK2_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "TASK 2")
+
+def open_frames(path, frames_skipped=1):
+    """
+    Function that returns 1 out of frames_skipped frames of a frame store (mapped, not read) or, one at a time
+    from a generator, of a folder of images or of any other file, taken as a video.
+    Without a path, the frames written by frames.py are used.
+    """
+    from frame_store import FrameStore
+
+    if path is None:
+        from codecs_motionCompensation import FRAMES_STORE, FRAMES_FOLDER
+        path = FRAMES_STORE if os.path.exists(FRAMES_STORE) else FRAMES_FOLDER
+
+    if os.path.isdir(path):
+        from frame_store import read_images
+        return read_images(path, frames_skipped)
+
+    with open(path, "rb") as file:
+        magic = file.read(len(FrameStore.MAGIC))
+    if magic == FrameStore.MAGIC:
+        from frame_store import load_frames
+        return load_frames(path)[::frames_skipped]
+
+    from frames import read_video
+    return read_video(path, frames_skipped)
+
+def make_parent(path):
+    """
+    Function that creates the folder of a file if it does not exist yet.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+def extract(args):
+    """
+    Function that cuts a video into grayscale frames and writes them, their predictions and their prediction errors
+    in frame stores.
+    """
+    from frames import process_video
+
+    # the frames are written as they are read, only their number comes back
+    count = process_video(args.input, args.frames_skipped, args.images, args.output, args.output)
+    print("Extracted " + str(count) + " frames in " + args.output)
+
+def encode(args):
+    """
+    Function that encodes frames into a video container.
+    """
+    from codecs_motionCompensation import encode_to_container
+
+    make_parent(args.output)
+
+    strategy = args.strategy if args.strategy is not None else "three_step"
+    threshold = args.threshold if args.threshold is not None else 2
+
+    start = time.time()
+    pipeline = encode_to_container(open_frames(args.input, args.frames_skipped), args.output, args.gop_size,
+                                   args.workers, strategy, args.search_range, args.precision, args.partition,
+                                   args.block_size, predictive=args.predictive, threshold=threshold,
+                                   levels=args.levels)
+    print("Encoded " + str(pipeline.stats["source"]["items"]) + " groups of pictures in "
+          + "{:.3f}".format(time.time() - start) + " s: " + str(os.path.getsize(args.output)) + " bytes")
+    print(pipeline.report())
+
+def decode(args):
+    """
+    Function that decodes the frames of a video container into a frame store or a folder of images.
+    """
+    from codecs_motionCompensation import decode_from_container
+
+    make_parent(args.output)
+    if args.residuals is not None:
+        make_parent(args.residuals)
+
+    start = time.time()
+    pipeline = decode_from_container(args.input, args.output, args.frames_skipped, args.residuals)
+    print("Decoded " + str(pipeline.stats["write"]["items"]) + " frames in " + "{:.3f}".format(time.time() - start)
+          + " s into " + args.output)
+    print(pipeline.report())
+
+def remove_object(args):
+    """
+    Function that removes the moving car from the frames and writes the video without it. The frames are put
+    together and written at the same time.
+    """
+    import cv2
+    import numpy as np
+    from pipeline import Pipeline, Stage
+    sys.path.insert(0, TASK2_FOLDER)
+    from remove_car import get_car, remove_car, final_removement
+
+    frames = np.array(list(open_frames(args.input, args.frames_skipped)))
+    if len(frames) < 2:
+        raise ValueError("At least 2 frames are needed to remove the car")
+
+    car_frames = get_car(frames, os.path.join(args.work, "specific_area"))
+    no_car = remove_car(frames, car_frames, os.path.join(args.work, "no_car"))
+
+    make_parent(args.output)
+    height, width = frames.shape[1:3]
+    video_writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*"mp4v"), args.fps, (width, height))
+
+    def compose(i):
+        final = final_removement(no_car[i], frames[i + 1].copy())
+        return cv2.cvtColor(final, cv2.COLOR_GRAY2BGR)
+
+    def write(final):
+        video_writer.write(final)
+        return final.nbytes
+
+    try:
+        pipeline = Pipeline([Stage("compose", compose, args.workers or 1), Stage("write", write, ordered=True)])
+        for size in pipeline.run(range(len(no_car))):
+            pass
+    finally:
+        video_writer.release()
+
+    print("Wrote " + str(len(no_car)) + " frames without the car in " + args.output)
+    print(pipeline.report())
+
+def bench(args):
+    """
+    Function that runs one of the benchmarks with the remaining arguments.
+    """
+    if args.which == "motion":
+        from benchmark_motion import main
+    else:
+        from benchmark_entropy import main
+
+    main(args.arguments)
+
+def get_parser():
+    """
+    Function that returns the parser of the command line, with a subcommand for every step.
+    """
+    parser = argparse.ArgumentParser(description="Frame extraction, motion compensated coding and car removal.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("extract", help="cut a video into frames, predictions and prediction errors")
+    command.add_argument("input", help="video to cut")
+    command.add_argument("-o", "--output", default="huffman_encoding", help="folder of the frame stores")
+    command.add_argument("--frames-skipped", type=int, default=10, help="keep 1 out of that many frames")
+    command.add_argument("--images", action="store_true", help="save the frames as JPEG images too")
+    command.set_defaults(function=extract)
+
+    command = commands.add_parser("encode", help="encode frames into a video container")
+    command.add_argument("input", nargs="?", help="frame store, folder of images or video (default: the frames "
+                                                  "extracted in huffman_encoding)")
+    command.add_argument("-o", "--output", default="motion_compensation/video.mcv", help="video container to write")
+    command.add_argument("--frames-skipped", type=int, default=1, help="keep 1 out of that many frames")
+    command.add_argument("--gop-size", type=int, default=12, help="frames per group of pictures (one I-frame each)")
+    command.add_argument("--block-size", type=int, default=16, help="size of the macroblocks")
+    command.add_argument("--search-range", type=int, default=7, help="search range of the motion search")
+    command.add_argument("--strategy", help="motion search: fixed, full, three_step (default), diamond or hexagon - "
+                                            "not with --partition, which always runs a full search")
+    command.add_argument("--levels", type=int, default=0,
+                         help="estimate the motion on frames downsampled that many times first, to find motion of "
+                              "up to about search range * 2 ** levels pixels")
+    command.add_argument("--precision", type=int, default=1, choices=[1, 2, 4],
+                         help="motion vectors in whole, half or quarter pixels")
+    command.add_argument("--partition", action="store_true", help="split the macroblocks where that pays off")
+    command.add_argument("--predictive", action="store_true",
+                         help="start the motion search from the vectors of the neighbouring macroblocks and stop it "
+                              "early for the blocks that match well enough")
+    command.add_argument("--threshold", type=float,
+                         help="mean absolute difference per pixel under which --predictive stops (default 2)")
+    command.add_argument("--workers", type=int, help="encoding processes (default: as many as the cores)")
+    command.set_defaults(function=encode)
+
+    command = commands.add_parser("decode", help="decode a video container into frames")
+    command.add_argument("input", help="video container to read")
+    command.add_argument("-o", "--output", default="motion_compensation/reconstructed_frames.store",
+                         help="frame store (ending with .store) or folder of images to write")
+    command.add_argument("--frames-skipped", type=int, default=1, help="decode 1 out of that many frames")
+    command.add_argument("--residuals", help="frame store where the residual frames of the P-frames are written")
+    command.set_defaults(function=decode)
+
+    command = commands.add_parser("remove-object", help="remove the moving car from a video")
+    command.add_argument("input", help="folder of images, frame store or video")
+    command.add_argument("-o", "--output", default="no-car.mp4", help="video to write")
+    command.add_argument("--frames-skipped", type=int, default=1, help="keep 1 out of that many frames")
+    command.add_argument("--work", default="frames", help="folder of the intermediate images")
+    command.add_argument("--fps", type=float, default=1, help="frames per second of the video")
+    command.add_argument("--workers", type=int, help="threads putting the frames together")
+    command.set_defaults(function=remove_object)
+
+    command = commands.add_parser("bench", help="run a benchmark, the other arguments are passed to it")
+    command.add_argument("which", choices=["motion", "entropy"], help="benchmark to run")
+    command.add_argument("arguments", nargs=argparse.REMAINDER, help="arguments of the benchmark")
+    command.set_defaults(function=bench)
+
+    return parser
+
+def main(argv=None):
+    """
+    Main function.
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "strategy", None) is not None:
+        # the strategies are only looked up when one is given, so that building the parser does not import numpy
+        from motion_compensation import SEARCH_STRATEGIES
+        if args.strategy not in SEARCH_STRATEGIES:
+            parser.error("--strategy must be one of " + ", ".join(sorted(SEARCH_STRATEGIES)))
+    if getattr(args, "frames_skipped", 1) < 1:
+        parser.error("--frames-skipped must be at least 1")
+    if getattr(args, "partition", False) and (args.strategy is not None or args.predictive or args.levels > 0):
+        parser.error("--partition always runs a full search, it cannot be combined with --strategy, --predictive "
+                     "or --levels")
+    if getattr(args, "levels", 0) < 0:
+        parser.error("--levels must be at least 0")
+    if getattr(args, "threshold", None) is not None and not args.predictive:
+        parser.error("--threshold only applies to --predictive")
+
+    args.function(args)
+
+if __name__ == "__main__":
+    main()
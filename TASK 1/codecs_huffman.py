@@ -1,10 +1,15 @@
 import cv2
 import numpy as np 
 import os 
-import math
+import time
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor
 from natsort import natsorted
 from huffman import HuffmanCoding
+from rans import RansCoding
+from run_length import encode_zero_runs
+from entropy import create_freq_array
+from frame_store import load_frames
 
 def jpg_to_txt():
     """
@@ -23,7 +28,7 @@ def jpg_to_txt():
     error_frames = np.array(error_frames)
 
     # check if a folder to save the pixel values for each frame exists - if not, create it
-    if not os.path.exists('huffman_encoding/error_frames/pixel_values)'):
+    if not os.path.exists('huffman_encoding/error_frames/pixel_values'):
         os.makedirs('huffman_encoding/error_frames/pixel_values')
 
     txt_names = []
@@ -35,9 +40,7 @@ def jpg_to_txt():
         one_d = error_frames[i].flatten()   # convert the 2d array into 1d
         
         # create the name of the txt file and add it in an array- it will be the same as the error frame's name
-        temp = os.path.splitext(filenames[i])[0] + ".txt"
-        temp2 = temp.split('\\')
-        txt_name = temp2[1]
+        txt_name = os.path.splitext(os.path.basename(sorted[i]))[0] + ".txt"
         txt_names.append(txt_name)
 
         a_file = open("huffman_encoding/error_frames/pixel_values/" + str(txt_name), "w")
@@ -49,18 +52,229 @@ def jpg_to_txt():
     return txt_names
 
 def encode_decode(filename):
-    path = "C:\\Users\\golem\\Desktop\\TASK 1\\huffman_encoding\\error_frames\\pixel_values\\" + filename
+    path = os.path.join("huffman_encoding", "error_frames", "pixel_values", filename)
     H = HuffmanCoding(path)
     output_path = H.encode()
     H.decode(output_path)
 
     print("Finished with: " + filename)
 
+# the entropy coders that can be used, all of them with the same interface
+BACKENDS = {"huffman": HuffmanCoding, "rans": RansCoding}
+
+def choose_backend(frame, zero_runs=False):
+    """
+    Function that returns the name of the backend expected to give the smallest output for the frame,
+    based on the estimated size of each backend for its histogram.
+    """
+    values = encode_zero_runs(frame) if zero_runs else frame
+    symbols, frequency, offset = create_freq_array(values)
+
+    sizes = {name: BACKENDS[name]().estimate_size(frequency) for name in BACKENDS}
+
+    return min(sizes, key=sizes.get)
+
+def decode_container(data):
+    """
+    Function that decodes a container written by any of the backends, recognized by its first bytes.
+    """
+    for backend in BACKENDS.values():
+        if bytes(data[:4]) == backend.CONTAINER_MAGIC:
+            return backend().decode_container(data)
+
+    raise ValueError("Unknown container type")
+
+def load_frame(item):
+    """
+    Function that returns the frame of a batch item, which is either the frame itself
+    or the path of an image that is read as grayscale.
+    """
+    if isinstance(item, (str, os.PathLike)):
+        frame = cv2.imread(str(item), cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            raise ValueError("Could not read the image " + str(item))
+        return frame
+
+    return np.asarray(item)
+
+def get_frame_name(item, index):
+    """
+    Function that returns the name used for the encoded output of a batch item:
+    the name of the image for paths, frame<index> for frames.
+    """
+    if isinstance(item, (str, os.PathLike)):
+        return os.path.splitext(os.path.basename(str(item)))[0]
+
+    return "frame" + str(index)
+
+def frame_histogram(job):
+    """
+    Function that returns the histogram of the symbols of a batch item and the value of its first bin.
+    """
+    item, zero_runs = job
+
+    frame = load_frame(item)
+    if zero_runs:
+        frame = encode_zero_runs(frame)
+
+    symbols, frequency, offset = create_freq_array(frame)
+
+    return frequency, offset
+
+def merge_histograms(histograms):
+    """
+    Function that adds the histograms of several frames (that may start from different values) into one.
+    Returns the merged histogram and the value of its first bin.
+    """
+    histograms = [(frequency, offset) for frequency, offset in histograms if len(frequency) > 0]
+    if len(histograms) == 0:
+        return np.zeros(0, dtype=np.int64), 0
+
+    offset = min(offset for frequency, offset in histograms)
+    size = max(offset_i + len(frequency) for frequency, offset_i in histograms) - offset
+
+    merged = np.zeros(size, dtype=np.int64)
+    for frequency, offset_i in histograms:
+        merged[offset_i - offset:offset_i - offset + len(frequency)] += frequency
+
+    return merged, offset
+
+def encode_frame(job):
+    """
+    Function that encodes a single batch item in a worker process. If a code table is given in the job
+    it is used, otherwise the frame gets its own. The result is written in the output folder, if there is one.
+    """
+    name, item, output_folder, code_lengths, offset, zero_runs, backend = job
+
+    frame = load_frame(item)
+
+    start = time.perf_counter()
+    if backend == "auto":
+        backend = choose_backend(frame, zero_runs)
+
+    if backend == "huffman":
+        data = HuffmanCoding().encode_container(frame, code_lengths, offset, zero_runs)
+    else:
+        data = BACKENDS[backend]().encode_container(frame, zero_runs=zero_runs)
+    elapsed = time.perf_counter() - start
+
+    result = {"name": name, "backend": backend, "raw_size": frame.nbytes, "size": len(data), "time": elapsed}
+
+    if output_folder is None:
+        result["data"] = data
+    else:
+        result["path"] = os.path.join(output_folder, name + ".bin")
+        with open(result["path"], "wb") as output:
+            output.write(data)
+
+    return result
+
+def encode_batch(items, output_folder=None, shared_table=False, workers=None, names=None, zero_runs=False,
+                 backend="huffman"):
+    """
+    Function that encodes a list of frames (numpy arrays or paths of images) using a pool of processes.
+    - zero_runs: if True the runs of zeros are replaced by run symbols before the entropy coding.
+    - backend: "huffman", "rans" or "auto" to pick, for every frame, the backend with the smallest estimated size.
+    - names: the names of the outputs, by default the names of the images or frame<index> for arrays.
+    - shared_table: if True all the frames are encoded with one code table built from their merged histogram,
+      otherwise every frame gets its own table.
+    - workers: number of processes, by default as many as the cores.
+    Returns a list with the name, the raw and the encoded size and the encoding time of each frame, in the
+    order of the items. The encoded bytes are returned too, or written in output_folder as <name>.bin if given.
+    """
+    items = list(items)
+
+    if backend != "auto" and backend not in BACKENDS:
+        raise ValueError("Unknown backend " + str(backend))
+    if shared_table and backend != "huffman":
+        raise ValueError("A shared code table is only supported by the huffman backend")
+
+    if output_folder is not None and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        code_lengths, offset = None, 0
+
+        if shared_table:
+            frequency, offset = merge_histograms(pool.map(frame_histogram, [(item, zero_runs) for item in items]))
+            H = HuffmanCoding()
+            H.create_code_arrays(frequency)
+            code_lengths = H.code_lengths
+
+        if names is None:
+            names = [get_frame_name(items[i], i) for i in range(len(items))]
+
+        jobs = [(names[i], items[i], output_folder, code_lengths, offset, zero_runs, backend) for i in range(len(items))]
+        # map returns the results in the order of the jobs, whichever worker finishes first
+        results = list(pool.map(encode_frame, jobs))
+
+    return results
+
+def get_residuals(frames):
+    """
+    Function that returns the signed prediction error of each frame, where every frame is predicted
+    by the previous one as in frames.py. The first frame is predicted by an all-zero frame, so that
+    the whole sequence can be rebuilt from the residuals.
+    """
+    frames = np.asarray(frames).astype(np.int16)
+
+    residuals = np.empty_like(frames)
+    residuals[0] = frames[0]
+    residuals[1:] = frames[1:] - frames[:-1]
+
+    return residuals
+
+def reconstruct_frames(residuals):
+    """
+    Function that rebuilds the frames by adding each residual to the previous frame.
+    """
+    return np.cumsum(residuals, axis=0, dtype=np.int16).astype(np.uint8)
+
+def encode_frames(frames, output_folder=None, shared_table=None, workers=None, zero_runs=True, backend="huffman"):
+    """
+    Function that encodes a sequence of frames straight from their pixel values, without any text files.
+    The symbols given to the Huffman coder are the signed residual values themselves (-255...255),
+    with the runs of zeros replaced by run symbols unless zero_runs is False.
+    Returns the results of encode_batch, whose outputs are named residual<index>.
+    A shared table can only be used with the huffman backend, which shares one by default (shared_table None), and
+    is only shared by the residuals of the frames after the first one: the first frame is stored as its pixel
+    values, whose histogram has nothing to do with that of the residuals, so it always gets its own table.
+    """
+    if shared_table is None:
+        shared_table = backend == "huffman"
+
+    residuals = get_residuals(frames)
+    names = ["residual" + str(i) for i in range(len(residuals))]
+
+    results = encode_batch(list(residuals[:1]), output_folder, False, workers, names[:1], zero_runs, backend)
+    if len(residuals) > 1:
+        results += encode_batch(list(residuals[1:]), output_folder, shared_table, workers, names[1:], zero_runs,
+                                backend)
+
+    return results
+
+def decode_frames(encoded):
+    """
+    Function that decodes the residuals encoded by encode_frames (given as bytes) and rebuilds the frames.
+    """
+    residuals = np.array([decode_container(data) for data in encoded])
+
+    return reconstruct_frames(residuals)
+
 if __name__ == "__main__":
-    txt_names = jpg_to_txt()
+    frames = load_frames("huffman_encoding/frames")
+
+    results = encode_frames(frames, "huffman_encoding/residuals")
+
+    for result in results:
+        print(result["name"] + " (" + result["backend"] + "): " + str(result["raw_size"]) + " -> " + str(result["size"]) + " bytes in "
+              + "{:.3f}".format(result["time"]) + " s")
 
-    print(txt_names)
+    # make sure the frames can be rebuilt exactly from the encoded residuals
+    encoded = []
+    for result in results:
+        with open(result["path"], "rb") as file:
+            encoded.append(file.read())
 
-    for i in range(len(txt_names)):
-        j = txt_names[i]
-        encode_decode(j)
+    decoded = decode_frames(encoded)
+    print("Lossless: " + str(np.array_equal(decoded, frames)))
@@ -1,86 +1,490 @@
-from genericpath import exists
 import numpy as np
 import cv2
-import random
 import time
 import os
-from natsort import natsorted
-from glob import glob
-from numpy.core.arrayprint import format_float_scientific
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from motion_compensation import *
+from codecs_huffman import BACKENDS, choose_backend, decode_container
+from frame_store import FrameStore, load_frames
+from pipeline import Pipeline, Stage
 
-# filenames contains the path for every frame in the frames folder
-filenames = [frame for frame in glob("huffman_encoding/frames/*.jpg")]
-sorted = natsorted(filenames)
-# store the frames
-frames = []
-for frame in sorted:
-    temp = cv2.imread(frame, cv2.IMREAD_GRAYSCALE)    # read the frames as grayscale
-    frames.append(temp)
-# convert to numpy array
-frames = np.array(frames)
+# where the frames written by frames.py are found: the store, or else the folder of images
+FRAMES_STORE = "huffman_encoding/frames.store"
+FRAMES_FOLDER = "huffman_encoding/frames"
 
-def encoder(iframe, target_frame):
+def get_frames(path=None):
+    """
+    Function that loads the frames when they are needed (a frame store is only mapped, not read), from the given
+    store or folder of images, by default from those written by frames.py.
+    """
+    if path is None:
+        path = FRAMES_STORE if os.path.exists(FRAMES_STORE) else FRAMES_FOLDER
+
+    return load_frames(path)
+
+PFRAME_MAGIC = b"PFRM"
+PFRAME_VERSION = 1
+# magic, version, block size, motion vector precision and the sizes of the vectors, residual and partition sections
+PFRAME_HEADER = "<4sBBBQQQ"
+
+def encoder(iframe, target_frame, strategy="three_step", search_range=7, block_size=16, precision=1, partition=False,
+            split_penalty=16, predictive=False, threshold=2, levels=0):
     """
     Function that implements the encoding process using the predefined methods.
+    With predictive, the motion search is seeded with the vectors of the neighbouring macroblocks and stops for the
+    blocks whose mean absolute difference per pixel is below threshold (see predictive_search).
+    With levels > 0 the motion is first estimated on frames downsampled levels times (see estimate_motion).
+    With partition, the macroblocks are split in 8x8 and 4x4 blocks where that pays off (see partition_motion,
+    which always runs a full search).
+    Returns the motion vectors, in 1 / precision of a pixel, the residual frame, both as integer arrays, and
+    the partition sizes (None without partition). The vectors are those of the macroblocks or, with partition,
+    those of the partitions in the order of get_partition_vectors.
     """
-    predicted_frame = create_predicted(iframe, target_frame)
+    if partition and block_size != PARTITION_SIZES[0]:
+        raise ValueError("Variable block sizes need " + str(PARTITION_SIZES[0]) + "x" + str(PARTITION_SIZES[0])
+                         + " macroblocks")
+
+    if not partition:
+        vectors, predicted_frame = block_matching(iframe, target_frame, strategy, search_range, block_size, levels,
+                                                  predictive, threshold, precision)
+        sizes = None
+    else:
+        sizes, field, evaluations = partition_motion(iframe, target_frame, search_range, split_penalty, precision)
+        predicted_frame = predict_from_field(iframe, field, precision)
+        vectors = get_partition_vectors(sizes, field)
+
     residual_frame = find_residual(target_frame, predicted_frame)
 
-    return predicted_frame, residual_frame
+    return vectors.astype(np.int16), residual_frame, sizes
 
-def decoder(residual_frame, predicted_frame):
+def decoder(iframe, vectors, residual_frame, block_size=16, precision=1, sizes=None):
     """
     Function that implements the decoding process using the predefined methods.
+    The predicted frame is rebuilt from the reference frame and the motion vectors (and partition sizes, if any).
     """
+    if sizes is None:
+        predicted_frame = predict_from_vectors(iframe, vectors, block_size, precision)
+    else:
+        predicted_frame = predict_from_field(iframe, get_vector_field(sizes, vectors), precision)
     reconstructed_frame = reconstruct_target(residual_frame, predicted_frame)
 
     return reconstructed_frame
 
-def helper(previous_frame, next_frame):
+def encode_pframe(vectors, residual_frame, block_size=16, backend=None, precision=1, sizes=None):
+    """
+    Function that packs a P-frame into bytes: a header with the block size, the motion vector precision and the
+    length of each section, followed by the entropy coded motion vectors, the entropy coded residual frame and,
+    with variable block sizes, the entropy coded partition sizes (stored as 0, 1 or 2 splits).
+    The backend of each section is picked by choose_backend unless one is given.
+    """
+    arrays = [vectors, residual_frame]
+    if sizes is not None:
+        arrays.append(np.log2(block_size // sizes).astype(np.uint8))
+
+    sections = []
+    for array in arrays:
+        name = backend if backend is not None else choose_backend(array, zero_runs=True)
+        sections.append(BACKENDS[name]().encode_container(array, zero_runs=True))
+    if sizes is None:
+        sections.append(b"")
+
+    header = struct.pack(PFRAME_HEADER, PFRAME_MAGIC, PFRAME_VERSION, block_size, precision,
+                         len(sections[0]), len(sections[1]), len(sections[2]))
+
+    return header + b"".join(sections)
+
+def decode_pframe(data):
+    """
+    Function that unpacks the bytes returned by encode_pframe - returns the motion vectors, the residual frame,
+    the block size, the motion vector precision and the partition sizes (None without variable block sizes).
+    """
+    if len(data) < 5:
+        raise ValueError("Truncated P-frame")
+
+    magic, version = struct.unpack("<4sB", data[:5])
+    if magic != PFRAME_MAGIC:
+        raise ValueError("Not a P-frame")
+    if version != PFRAME_VERSION:
+        raise ValueError("Unsupported P-frame version " + str(version))
+
+    header_size = struct.calcsize(PFRAME_HEADER)
+    if len(data) < header_size:
+        raise ValueError("Truncated P-frame")
+
+    _, _, block_size, precision, vectors_size, residual_size, sizes_size = struct.unpack(PFRAME_HEADER,
+                                                                                       data[:header_size])
+
+    if len(data) != header_size + vectors_size + residual_size + sizes_size:
+        raise ValueError("Truncated P-frame")
+
+    start = header_size
+    vectors = decode_container(data[start:start + vectors_size])
+    start += vectors_size
+    residual_frame = decode_container(data[start:start + residual_size])
+    start += residual_size
+
+    sizes = None
+    if sizes_size > 0:
+        sizes = (block_size >> decode_container(data[start:])).astype(np.uint8)
+
+    return vectors, residual_frame, block_size, precision, sizes
+
+def encode_iframe(frame, backend=None):
+    """
+    Function that entropy codes an I-frame on its own - returns the container bytes of the chosen backend.
+    """
+    name = backend if backend is not None else choose_backend(frame)
+
+    return BACKENDS[name]().encode_container(frame)
+
+def split_gops(frames, gop_size):
+    """
+    Function that splits the frames in groups of pictures of gop_size frames, the first one of each being an I-frame.
+    """
+    if gop_size < 1:
+        raise ValueError("The GOP size must be at least 1")
+
+    return [frames[i:i + gop_size] for i in range(0, len(frames), gop_size)]
+
+def encode_gop(job):
+    """
+    Function that encodes a group of pictures, job being (frames, strategy, search_range, precision, partition,
+    block_size, predictive, threshold, levels).
+    The first frame is an I-frame and every other frame a P-frame predicted from the decoded reconstruction of
+    the previous one, so the encoder uses the same references as the decoder (closed loop).
+    Returns the bytes of every frame.
+    """
+    gop_frames, strategy, search_range, precision, partition, block_size, predictive, threshold, levels = job
+
+    encoded = [encode_iframe(gop_frames[0])]
+    # the I-frame is coded losslessly, so the decoder gets the frame itself back
+    reference = np.asarray(gop_frames[0], dtype=np.uint8)
 
-    predicted_frame, residual_frame = encoder(previous_frame, next_frame)
-    reconstructed_frame = decoder(residual_frame, predicted_frame) 
-    
-    return predicted_frame, residual_frame, reconstructed_frame
+    for target_frame in gop_frames[1:]:
+        vectors, residual_frame, sizes = encoder(reference, target_frame, strategy, search_range, block_size,
+                                                 precision, partition, predictive=predictive, threshold=threshold,
+                                                 levels=levels)
+        encoded.append(encode_pframe(vectors, residual_frame, block_size, precision=precision, sizes=sizes))
+        reference = decoder(reference, vectors, residual_frame, block_size, precision, sizes)
 
-def main():
+    return encoded
+
+def encode_video(frames, gop_size=12, workers=None, strategy="three_step", search_range=7, precision=1,
+                 partition=False, block_size=16, predictive=False, threshold=2, levels=0):
+    """
+    Function that encodes a sequence of frames in groups of pictures of gop_size frames (one I-frame every gop_size
+    frames). The groups are independent, so they are encoded in parallel by a pool of processes.
+    - workers: number of processes, by default as many as the cores.
+    - precision: 1, 2 or 4 for motion vectors in whole, half or quarter pixels.
+    - partition: if True the macroblocks are split in 8x8 and 4x4 blocks where that pays off.
+    - predictive: if True the motion search starts from the vectors of the neighbours and stops early for the blocks
+      whose mean absolute difference per pixel is below threshold.
+    - levels: if above 0 the motion is first estimated on frames downsampled that many times, which finds motion
+      of up to about search_range * 2 ** levels pixels.
+    Returns the bytes of every frame, in the order of the frames.
+    """
+    jobs = [(gop, strategy, search_range, precision, partition, block_size, predictive, threshold, levels)
+            for gop in split_gops(frames, gop_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map returns the groups in the order of the jobs, whichever worker finishes first
+        gops = list(pool.map(encode_gop, jobs))
+
+    return [data for gop in gops for data in gop]
+
+def decode_video(encoded):
+    """
+    Function that decodes the bytes returned by encode_video - returns the reconstructed frames.
+    """
+    reconstructed = []
+    for data in encoded:
+        if bytes(data[:4]) == PFRAME_MAGIC:
+            if len(reconstructed) == 0:
+                raise ValueError("The first frame must be an I-frame")
+            vectors, residual_frame, block_size, precision, sizes = decode_pframe(data)
+            reconstructed.append(decoder(reconstructed[-1], vectors, residual_frame, block_size, precision, sizes))
+        else:
+            reconstructed.append(decode_container(data))
+
+    return np.array(reconstructed)
+
+# the video container: a header, the bytes of every frame and an index with the offset, size and type of every frame
+VIDEO_MAGIC = b"MCVC"
+VIDEO_VERSION = 1
+# magic, version, frame count, offset of the index and checksum of the index
+VIDEO_HEADER = "<4sBQQI"
+VIDEO_INDEX_ENTRY = "<QQB"
+FRAME_I = 0
+FRAME_P = 1
+
+class VideoWriter:
+    """
+    Writes the bytes of the frames in a video container, one frame after the other as they come. The index of
+    the frames is written after them when the writer is closed, so the number of frames need not be known.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(b"\0" * struct.calcsize(VIDEO_HEADER))
+        self.index = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        """
+        Function that writes the bytes of the next frame.
+        """
+        frame_type = FRAME_P if bytes(data[:4]) == PFRAME_MAGIC else FRAME_I
+        self.index.append(struct.pack(VIDEO_INDEX_ENTRY, self.file.tell(), len(data), frame_type))
+        self.file.write(data)
+
+    def close(self):
+        """
+        Function that writes the index, then the header once the position of the index is known.
+        """
+        if self.file.closed:
+            return
+
+        index = b"".join(self.index)
+        index_offset = self.file.tell()
+        self.file.write(index)
+
+        self.file.seek(0)
+        self.file.write(struct.pack(VIDEO_HEADER, VIDEO_MAGIC, VIDEO_VERSION, len(self.index), index_offset,
+                                    zlib.crc32(index)))
+        self.file.close()
+
+def write_container(path, encoded):
+    """
+    Function that writes the bytes of the frames returned by encode_video in a single video container file.
+    """
+    with VideoWriter(path) as writer:
+        for data in encoded:
+            writer.write(data)
+
+class VideoReader:
+    """
+    Random access to the frames of a video container: a frame is decoded from the closest I-frame before it,
+    reading only the bytes of the frames in between. The last decoded frame is kept, so reading the frames
+    in order decodes every frame once.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+
+        header = self.file.read(struct.calcsize(VIDEO_HEADER))
+        if len(header) < struct.calcsize(VIDEO_HEADER):
+            raise ValueError("Truncated video container")
+
+        magic, version, count, index_offset, checksum = struct.unpack(VIDEO_HEADER, header)
+        if magic != VIDEO_MAGIC:
+            raise ValueError("Not a video container")
+        if version != VIDEO_VERSION:
+            raise ValueError("Unsupported video container version " + str(version))
+
+        self.file.seek(index_offset)
+        index = self.file.read(count * struct.calcsize(VIDEO_INDEX_ENTRY))
+        if len(index) < count * struct.calcsize(VIDEO_INDEX_ENTRY) or zlib.crc32(index) != checksum:
+            raise ValueError("Corrupted video container index")
+
+        entries = list(struct.iter_unpack(VIDEO_INDEX_ENTRY, index))
+        self.offsets = [entry[0] for entry in entries]
+        self.sizes = [entry[1] for entry in entries]
+        self.frame_types = [entry[2] for entry in entries]
+
+        # the last decoded frame, its number and its residual frame (None for an I-frame)
+        self.last_number = None
+        self.last_frame = None
+        self.last_residual = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def read_payload(self, number):
+        """
+        Function that returns the bytes of a frame, without decoding them.
+        """
+        self.file.seek(self.offsets[number])
+        data = self.file.read(self.sizes[number])
+        if len(data) < self.sizes[number]:
+            raise ValueError("Truncated video container")
+
+        return data
+
+    def get_frame(self, number):
+        """
+        Function that decodes and returns a frame, from the closest I-frame before it or from the last decoded
+        frame if that is closer. The residual frame of a P-frame is kept in last_residual.
+        """
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError("Frame " + str(number) + " out of range")
+
+        start = number
+        while self.frame_types[start] != FRAME_I:
+            start -= 1
+            if start < 0:
+                raise ValueError("The first frame must be an I-frame")
+
+        if self.last_number is not None and start <= self.last_number <= number:
+            start, frame, residual_frame = self.last_number + 1, self.last_frame, self.last_residual
+        else:
+            frame, residual_frame = None, None
+
+        for current in range(start, number + 1):
+            data = self.read_payload(current)
+            if self.frame_types[current] == FRAME_I:
+                frame, residual_frame = decode_container(data), None
+            else:
+                vectors, residual_frame, block_size, precision, sizes = decode_pframe(data)
+                frame = decoder(frame, vectors, residual_frame, block_size, precision, sizes)
+
+        self.last_number, self.last_frame, self.last_residual = number, frame, residual_frame
+
+        return frame
+
+    def __getitem__(self, number):
+        return self.get_frame(number)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.get_frame(number)
+
+def get_gop_jobs(frames, gop_size, strategy="three_step", search_range=7, precision=1, partition=False,
+                 block_size=16, predictive=False, threshold=2, levels=0):
+    """
+    Generator that groups the frames of any iterable (a generator of decoded frames, a frame store...) in groups of
+    pictures of gop_size frames, without reading more frames than the group being built - yields the jobs of encode_gop.
+    """
+    if gop_size < 1:
+        raise ValueError("The GOP size must be at least 1")
+
+    gop = []
+    for frame in frames:
+        gop.append(frame)
+        if len(gop) == gop_size:
+            yield (np.array(gop), strategy, search_range, precision, partition, block_size, predictive, threshold,
+                   levels)
+            gop = []
+
+    if gop:
+        yield (np.array(gop), strategy, search_range, precision, partition, block_size, predictive, threshold,
+               levels)
+
+def encode_to_container(frames, path, gop_size=12, workers=None, strategy="three_step", search_range=7, precision=1,
+                        partition=False, block_size=16, queue_size=2, predictive=False, threshold=2, levels=0):
+    """
+    Function that encodes the frames of any iterable into a video container, as a pipeline: the frames are read
+    (decoded) in one thread, the groups of pictures encoded by a pool of processes and written in order in another
+    thread, all at the same time. At most queue_size groups wait between two stages, so the frames never need to be
+    all in memory. The options of the motion search are those of encode_video.
+    Returns the pipeline, whose stats give the time every stage was busy.
+    """
+    workers = workers if workers is not None else os.cpu_count()
+
+    with VideoWriter(path) as writer:
+        def write_gop(gop):
+            for data in gop:
+                writer.write(data)
+
+            return sum(len(data) for data in gop)
+
+        pipeline = Pipeline([Stage("encode", encode_gop, workers, processes=True),
+                             Stage("write", write_gop, ordered=True)], queue_size)
+
+        for size in pipeline.run(get_gop_jobs(frames, gop_size, strategy, search_range, precision, partition,
+                                              block_size, predictive, threshold, levels)):
+            pass
+
+    return pipeline
+
+def decode_from_container(path, output, step=1, residual_output=None):
+    """
+    Function that decodes 1 out of step frames of a video container and writes them in a frame store, if output ends
+    with .store, or else as JPEG images in the output folder. The frames are decoded in one thread and written in
+    another at the same time. If residual_output is given, the residual frames of the decoded P-frames are written
+    in a frame store there too. Returns the pipeline, whose stats give the time every stage was busy.
+    """
+    for path_i in (output, residual_output):
+        if path_i is not None and path_i.endswith(".store") and os.path.exists(path_i):
+            os.remove(path_i)
+    if not output.endswith(".store") and not os.path.isdir(output):
+        os.makedirs(output)
+
+    with VideoReader(path) as reader:
+        def decode_frame(number):
+            frame = reader.get_frame(number)
+            # the residual frame was decoded with the frame
+            return frame, reader.last_residual if residual_output is not None else None
+
+        stores = {}
+        written = []
+        def write_frame(decoded):
+            frame, residual_frame = decoded
+            items = [(output, frame), (residual_output, residual_frame)]
+
+            if not output.endswith(".store"):
+                cv2.imwrite(os.path.join(output, "frame" + str(len(written)) + ".jpg"), frame)
+                items = items[1:]
+            for path_i, item in items:
+                if item is None:
+                    continue
+                # the stores are created with the shape of the first frame
+                if path_i not in stores:
+                    stores[path_i] = FrameStore(path_i, item.shape, item.dtype)
+                stores[path_i].append(item)
+
+            written.append(frame.nbytes)
+
+            return frame.nbytes
+
+        pipeline = Pipeline([Stage("decode", decode_frame, ordered=True), Stage("write", write_frame, ordered=True)])
+        for size in pipeline.run(range(0, len(reader), step)):
+            pass
+
+    return pipeline
+
+def main(input=None, output="motion_compensation", gop_size=12, workers=None):
     """
     Main function.
     """
-    # check if the folders to store the frames exist - if not, create them
-    exists = os.path.isdir("motion_compensation")
-    if not exists:
-        os.mkdir("motion_compensation")
-
-    exists = os.path.isdir("motion_compensation/pframes")
-    if not exists:
-        os.mkdir("motion_compensation/pframes")
-    
-    exists = os.path.isdir("motion_compensation/target_frames")
-    if not exists:
-        os.mkdir("motion_compensation/target_frames")
-        
-    exists = os.path.isdir("motion_compensation/residual_frames")
-    if not exists:
-        os.mkdir("motion_compensation/residual_frames")
-
-    exists = os.path.isdir("motion_compensation/reconstructed_frames")
-    if not exists:
-        os.mkdir("motion_compensation/reconstructed_frames")   
-
-    predicted_frame, residual_frame, reconstructed_frame = helper(frames[0], frames[1])
-
-    for i in range(len(frames) + 1):
-        previous_frame = predicted_frame
-        next_frame = frames[i+1]
-        predicted_frame, residual_frame, reconstructed_frame = helper(predicted_frame, frames[i+1])
-
-        # save the images in a seperate folder
-        cv2.imwrite("motion_compensation/pframes/pframe" + str(i) + ".jpg", previous_frame)
-        cv2.imwrite("motion_compensation/target_frames/target_frame" + str(i) + ".jpg", next_frame)
-        cv2.imwrite("motion_compensation/residual_frames/residual_frame" + str(i) + ".jpg", residual_frame)
-        cv2.imwrite("motion_compensation/reconstructed_frames/reconstructed_frame" + str(i) + ".jpg", reconstructed_frame)
+    frames = get_frames(input)
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    # the whole video goes in one container, which can be read back from any frame
+    video_path = os.path.join(output, "video.mcv")
+    start = time.time()
+    pipeline = encode_to_container(frames, video_path, gop_size, workers)
+    print("Encoded " + str(len(frames)) + " frames in " + "{:.3f}".format(time.time() - start) + " s: "
+          + str(frames.nbytes) + " -> " + str(os.path.getsize(video_path)) + " bytes")
+    print(pipeline.report())
+
+    # the reconstructed frames and the residuals of the P-frames are kept losslessly in frame stores
+    reconstructed_path = os.path.join(output, "reconstructed_frames.store")
+    pipeline = decode_from_container(video_path, reconstructed_path,
+                                     residual_output=os.path.join(output, "residual_frames.store"))
+    print("Lossless: " + str(np.array_equal(load_frames(reconstructed_path), frames)))
+    print(pipeline.report())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,66 @@
+import struct
+import numpy as np
+
+# the fields that start the container of every entropy coder: magic, version and number of dimensions
+CONTAINER_START = "<4sBB"
+
+def create_freq_array(array):
+    """
+    Function that creates the histogram of the values of an integer array.
+    The values are shifted so that the smallest one becomes 0 and can be used as an index.
+    Returns the shifted symbols, the frequency of each one of them and the value of the first symbol (the offset).
+    """
+    values = np.asarray(array).ravel()
+
+    # unsigned arrays (e.g. uint8 frames) need no shifting, signed ones (e.g. residuals) are shifted by their minimum
+    if (values.dtype.kind == 'u' or values.size == 0):
+        offset = 0
+    else:
+        offset = int(values.min())
+
+    symbols = values.astype(np.intp) - offset
+    frequency = np.bincount(symbols)
+
+    return symbols, frequency, offset
+
+def read_exactly(file, size):
+    """
+    Function that reads `size` bytes from the file and complains if the file ends earlier.
+    """
+    data = file.read(size)
+    if (len(data) != size):
+        raise ValueError("The container ends unexpectedly")
+    return data
+
+def pack_array_header(magic, version, shape, dtype):
+    """
+    Function that packs the start of a container: its magic and version, then the shape and the type of the array.
+    """
+    dtype_name = np.dtype(dtype).str.encode()
+
+    header = struct.pack(CONTAINER_START, magic, version, len(shape))
+    header += struct.pack("<" + str(len(shape)) + "Q", *shape)
+    header += struct.pack("<B", len(dtype_name)) + dtype_name
+
+    return header
+
+def read_array_header(file, magic, version, name):
+    """
+    Function that reads the start of a container written by pack_array_header from an open file, checking its
+    magic and version (name is the kind of container, for the errors).
+    Returns the shape, the type and the bytes read, which are covered by the checksum.
+    """
+    header = read_exactly(file, struct.calcsize(CONTAINER_START))
+    found_magic, found_version, ndim = struct.unpack(CONTAINER_START, header)
+    if (found_magic != magic):
+        raise ValueError("Not a " + name + " container")
+    if (found_version != version):
+        raise ValueError("Unsupported container version " + str(found_version))
+
+    shape = read_exactly(file, 8 * ndim)
+    dtype_length = read_exactly(file, 1)
+    dtype_name = read_exactly(file, dtype_length[0])
+
+    header += shape + dtype_length + dtype_name
+
+    return struct.unpack("<" + str(ndim) + "Q", shape), np.dtype(dtype_name.decode()), header
@@ -0,0 +1,179 @@
+import os
+import struct
+import cv2
+import numpy as np
+from glob import glob
+from natsort import natsorted
+
+class FrameStore:
+    """
+    Lossless store of a sequence of frames of the same shape and type, kept in one file as a header followed by
+    the frames one after the other, so that the whole sequence is read as a single memory-mapped numpy array.
+
+    Indexing and slicing the store return views of the mapped file, without copying the frames. Frames can be
+    appended at any time, and any number of processes can read the store while a single one appends to it:
+    the frame count in the header is only updated once the new frames are written.
+    """
+
+    # identification of the file, its version, and the header: frame count, type and shape (up to 3 dimensions)
+    MAGIC = b"FRMS"
+    VERSION = 1
+    HEADER_FORMAT = "<4sBB8sQ3Q"
+    # the frames start after a fixed size header, which keeps them aligned
+    HEADER_SIZE = 64
+
+    def __init__(self, path, shape=None, dtype=np.uint8):
+        """
+        Function that opens the store at path, or creates it empty with frames of the given shape and type
+        if it does not exist yet.
+        """
+        self.path = path
+        self.mapped = None
+
+        if os.path.exists(path):
+            self.read_header()
+        else:
+            if shape is None:
+                raise FileNotFoundError("No frame store at " + str(path))
+            if len(shape) > 3:
+                raise ValueError("The frames can have up to 3 dimensions")
+
+            self.shape = tuple(int(size) for size in shape)
+            self.dtype = np.dtype(dtype)
+            self.count = 0
+
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(path, "wb") as file:
+                file.write(self.get_header())
+
+    def __getstate__(self):
+        # the mapping is not sent to other processes, they map the file again
+        state = self.__dict__.copy()
+        state["mapped"] = None
+
+        return state
+
+    def get_header(self):
+        """
+        Function that returns the header of the store.
+        """
+        shape = list(self.shape) + [0] * (3 - len(self.shape))
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC, self.VERSION, len(self.shape), self.dtype.str.encode(),
+                             self.count, *shape)
+
+        return header.ljust(self.HEADER_SIZE, b"\0")
+
+    def read_header(self):
+        """
+        Function that reads the header of the store: the frame count, type and shape.
+        """
+        with open(self.path, "rb") as file:
+            header = file.read(self.HEADER_SIZE)
+        if len(header) < self.HEADER_SIZE:
+            raise ValueError("Truncated frame store")
+
+        magic, version, ndim, dtype, count, *shape = struct.unpack_from(self.HEADER_FORMAT, header)
+        if magic != self.MAGIC:
+            raise ValueError("Not a frame store")
+        if version != self.VERSION:
+            raise ValueError("Unsupported frame store version " + str(version))
+
+        self.shape = tuple(shape[:ndim])
+        self.dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        self.count = count
+
+    def frame_bytes(self):
+        """
+        Function that returns the size of one frame in bytes.
+        """
+        return int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def get_frames(self):
+        """
+        Function that returns the frames as a read-only memory-mapped array of shape (count,) + shape,
+        mapping the file again if frames were appended since the last call (by this or by another process).
+        """
+        self.read_header()
+
+        if self.mapped is None or len(self.mapped) != self.count:
+            if self.count == 0:
+                self.mapped = np.empty((0,) + self.shape, dtype=self.dtype)
+            else:
+                self.mapped = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.HEADER_SIZE,
+                                        shape=(self.count,) + self.shape)
+
+        return self.mapped
+
+    def __len__(self):
+        self.read_header()
+
+        return self.count
+
+    def __getitem__(self, index):
+        return self.get_frames()[index]
+
+    def __iter__(self):
+        return iter(self.get_frames())
+
+    def append(self, frames):
+        """
+        Function that appends a frame, or an array of frames, at the end of the store.
+        """
+        frames = np.asarray(frames)
+        if frames.shape == self.shape:
+            frames = frames[np.newaxis]
+        if frames.shape[1:] != self.shape:
+            raise ValueError("Frames of shape " + str(frames.shape[1:]) + " do not fit in a store of frames of shape "
+                             + str(self.shape))
+        if frames.dtype != self.dtype:
+            raise ValueError("Frames of type " + str(frames.dtype) + " do not fit in a store of " + str(self.dtype))
+
+        self.read_header()
+
+        with open(self.path, "r+b") as file:
+            # the frames are written first and counted last, so readers never see a partial frame
+            file.seek(self.HEADER_SIZE + self.count * self.frame_bytes())
+            file.write(np.ascontiguousarray(frames).tobytes())
+            file.truncate()
+            file.flush()
+
+            self.count += len(frames)
+            file.seek(0)
+            file.write(self.get_header())
+
+def write_store(path, frames):
+    """
+    Function that writes the frames (an array of frames of the same shape and type) in a new store at path,
+    replacing any previous one - returns the store.
+    """
+    frames = np.asarray(frames)
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    store = FrameStore(path, frames.shape[1:], frames.dtype)
+    store.append(frames)
+
+    return store
+
+def read_images(folder, frames_skipped=1):
+    """
+    Generator that reads 1 out of frames_skipped .jpg images of the folder as grayscale, in natural order,
+    one at a time.
+    """
+    filenames = natsorted(glob(os.path.join(folder, "*.jpg")))
+
+    for filename in filenames[::frames_skipped]:
+        yield cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+
+def load_frames(path):
+    """
+    Function that returns the frames of a store as a memory-mapped array or, for a folder of images,
+    the grayscale images in natural order as an array.
+    """
+    if os.path.isfile(path):
+        return FrameStore(path).get_frames()
+
+    return np.array(list(read_images(path)))
@@ -1,41 +1,111 @@
 import cv2
 import numpy as np 
 import os 
-import math
 from glob import glob
 from natsort import natsorted
+from frame_store import FrameStore, load_frames
 
-def cut_frames():
+def read_video(path='grayscale.mp4', frames_skipped=10, folder=None):
     """
-    Function that cuts the video given into frames.
+    Generator that yields 1 out of frames_skipped frames of the video as grayscale numpy arrays.
+    The other frames are only grabbed, not decoded. If a folder is given, the frames are also saved in it as JPEG images.
     """
-    frames_skipped = 10     # save 1 out of 10 frames
-    cap = cv2.VideoCapture('grayscale.mp4')
+    cap = cv2.VideoCapture(path)
 
     # check if a folder to save the frames exists - if not, create it
-    try:
-        if not os.path.exists('huffman_encoding/frames'):
-            os.makedirs('huffman_encoding/frames')
-    except OSError:
-        print("Error creating folder!")
-        
+    if folder is not None and not os.path.exists(folder):
+        os.makedirs(folder)
+
     currentFrame = 0
-    length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    while (currentFrame < length):   # check if there are still frames in the video to read
-        
-        ret, frame = cap.read()     # capture frame-by-frame
-                
-        name = 'huffman_encoding/frames/frame' + str(math.trunc(currentFrame/10)) + '.jpg'
-
-        # save only 1 out of 10 frames
-        if (currentFrame // frames_skipped == currentFrame / frames_skipped):
-            print('Creating...' + name)
-            cv2.imwrite(name, frame)
-        
-        currentFrame += 1 
-        
-    cap.release()
+    try:
+        while cap.grab():   # move to the next frame without decoding it
+
+            # decode only 1 out of frames_skipped frames
+            if currentFrame % frames_skipped == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                if frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+                if folder is not None:
+                    name = folder + '/frame' + str(currentFrame // frames_skipped) + '.jpg'
+                    print('Creating...' + name)
+                    cv2.imwrite(name, frame)
+
+                yield frame
+
+            currentFrame += 1
+    finally:
+        cap.release()
+
+def predict_stream(frames):
+    """
+    Generator that yields every frame with its prediction: the previous frame (the first frame is its own prediction).
+    """
+    previous = None
+    for frame in frames:
+        yield frame, frame if previous is None else previous
+        previous = frame
+
+def error_stream(pairs):
+    """
+    Generator that yields every frame, its prediction and the prediction error (int16, so that it does not wrap
+    around), from the pairs of predict_stream.
+    """
+    for frame, predicted in pairs:
+        # error = actual_frame(n) - predicted_frame(n)
+        yield frame, predicted, np.subtract(frame, predicted, dtype=np.int16)
+
+def process_video(path='grayscale.mp4', frames_skipped=10, dump=False, store=None, folder='huffman_encoding'):
+    """
+    Function that streams the frames of the video through the prediction and the error stages, without going
+    through the disk. If dump is True the frames, the predicted frames and the error frames are also saved as JPEG
+    images in their folders in folder, as cut_frames, predict_frames and prediction_error do (the error frames
+    wrapped around to uint8, as before). If store is a folder, they are also appended losslessly to the frame stores
+    frames.store, predicted_frames.store and error_frames.store in it, replacing any previous ones.
+    Every frame is written as soon as it is read and then dropped, so memory does not grow with the video.
+    Returns the number of frames.
+    """
+    folders = [os.path.join(folder, name) for name in ['frames', 'predicted_frames', 'error_frames']]
+    if dump:
+        for dump_folder in folders[1:]:
+            if not os.path.exists(dump_folder):
+                os.makedirs(dump_folder)
+
+    stores = None
+    if store is not None:
+        store_paths = [os.path.join(store, name + '.store') for name in ['frames', 'predicted_frames', 'error_frames']]
+        for store_path in store_paths:
+            if os.path.exists(store_path):
+                os.remove(store_path)
+
+    count = 0
+
+    source = read_video(path, frames_skipped, folders[0] if dump else None)
+    for frame, predicted, error in error_stream(predict_stream(source)):
+        if dump:
+            cv2.imwrite(folders[1] + '/p_frame' + str(count) + '.jpg', predicted)
+            cv2.imwrite(folders[2] + '/error_frame' + str(count) + '.jpg', error.astype(np.uint8))
+
+        if store is not None:
+            # the stores are created with the shape of the first frame
+            if stores is None:
+                dtypes = [np.uint8, np.uint8, np.int16]
+                stores = [FrameStore(store_paths[i], frame.shape, dtypes[i]) for i in range(3)]
+            for frame_store, item in zip(stores, (frame, predicted, error)):
+                frame_store.append(item)
+
+        count += 1
+
+    return count
+
+def cut_frames(path='grayscale.mp4', frames_skipped=10, folder='huffman_encoding/frames'):
+    """
+    Function that cuts the video given into frames, saving 1 out of frames_skipped frames in the folder.
+    """
+    for frame in read_video(path, frames_skipped, folder):
+        pass
 
 def predict_frames():
     """
@@ -120,14 +190,20 @@ def display(folder_name, title):
         cv2.imshow(title, temp)
         cv2.waitKey(0)
 
+def show(frames, title):
+    """
+    Function that displays the given frames one after the other, like display does for a folder.
+    """
+    for frame in frames:
+        cv2.imshow(title, frame)
+        cv2.waitKey(0)
+
 if __name__ == "__main__":
-    cut_frames()
-    print("----------")
-    frames, predicted_frames = predict_frames()
-    print("----------")
-    prediction_error(frames, predicted_frames)
-
-    display("huffman_encoding/frames", "frames")
-    display("huffman_encoding/predicted_frames", "predicted_frames")
-    display("huffman_encoding/error_frames", "error_frames")
-      
\ No newline at end of file
+    # the frames are saved too, as the codecs read them from their folders or from the frame stores
+    process_video('grayscale.mp4', 10, dump=True, store='huffman_encoding')
+
+    # the frames are displayed from the stores, which are mapped rather than read
+    show(load_frames('huffman_encoding/frames.store'), "frames")
+    show(load_frames('huffman_encoding/predicted_frames.store'), "predicted_frames")
+    show(load_frames('huffman_encoding/error_frames.store').astype(np.uint8), "error_frames")
+        
\ No newline at end of file
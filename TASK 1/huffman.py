@@ -1,14 +1,80 @@
 import os
 import heapq
+import io
+import math
+import struct
+import zlib
+import numpy as np
+from run_length import encode_zero_runs, decode_zero_runs
+from entropy import create_freq_array, read_exactly, pack_array_header, read_array_header
+
+def pack_codes(values, lengths):
+    """
+    Function that writes codenames one after the other, each given by its value and its length in bits,
+    and returns the bytes they fill (the last one padded with 0's) and the number of bits.
+    Every codename is shifted into place in the 64-bit words it falls on, instead of writing one bit at a time:
+    the part that fits in its first word is combined with the other codenames of that word and the rest,
+    if any, goes to the start of the next word (codenames are at most 57 bits long, so they span two words at most).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    ends = np.cumsum(lengths)
+    n_bits = int(ends[-1]) if len(ends) > 0 else 0
+    words = np.zeros((n_bits + 63) // 64, dtype=np.uint64)
+
+    if (n_bits > 0):
+        starts = ends - lengths
+        word = starts >> 6
+        # end of each codename, counted from the first bit of its word
+        last = (starts & 63) + lengths
+
+        high = (values >> np.maximum(last - 64, 0).astype(np.uint64)) << np.maximum(64 - last, 0).astype(np.uint64)
+        # the codenames of a word are next to each other, so they are combined with one reduction per word
+        first = np.flatnonzero(np.diff(word, prepend=-1))
+        words[word[first]] = np.bitwise_or.reduceat(high, first)
+
+        # only the last codename of a word can go past its end
+        spilled = np.flatnonzero(last > 64)
+        words[word[spilled] + 1] |= values[spilled] << (128 - last[spilled]).astype(np.uint64)
+
+    return words.astype(">u8").view(np.uint8)[:(n_bits + 7) // 8], n_bits
 
 class HuffmanCoding:
 
+    # number of bits used to index the decoding table, longer codenames are resolved separately
+    TABLE_BITS = 15
+    # number of bit positions looked up at a time while decoding
+    DECODE_BLOCK_BITS = 1 << 16
+    # the codename starts are followed 2 ** JUMP_LEVELS codenames at a time while decoding
+    JUMP_LEVELS = 4
+    # length given to the positions where no codename starts
+    INVALID_LENGTH = 1 << 40
+
+    # longest codename created for numpy arrays, so that they are decoded with a single table lookup
+    MAX_CODE_LENGTH = 15
+
+    # identification of the self-describing container written by encode_container
+    CONTAINER_MAGIC = b"HUFF"
+    CONTAINER_VERSION = 2
+    # flags of the container header
+    FLAG_ZERO_RUNS = 1
+
     # during instantiation ask the path of the file that is going to be compressed
-    def __init__(self, path):
+    # (the path can be omitted when only numpy arrays are going to be encoded)
+    def __init__(self, path=None, max_code_length=MAX_CODE_LENGTH):
         self.path = path
+        self.max_code_length = max_code_length
         self.heap = []
         self.codes = {}
         self.reverse_codes = {}
+        # information kept when encoding numpy arrays, needed to decode them back
+        self.code_lengths = None
+        self.code_values = None
+        self.offset = 0
+        self.dtype = None
+        self.shape = None
+        self.zero_runs = False
 
     class HeapNode:
 
@@ -98,6 +164,9 @@ class HuffmanCoding:
         """
         root = heapq.heappop(self.heap)
         current_code = ""
+        # if there is only one character the root is a leaf, so give it a codename of one bit
+        if (root.char != None):
+            current_code = "0"
         self.create_codenames_help(root, current_code)
 
     def get_encoded_text(self, text):
@@ -163,37 +232,183 @@ class HuffmanCoding:
         return output_path
 
     # FUNCTIONS USED FOR THE DECODING PROCCESS
-    
-    def remove_padding(self, bit_string):
+
+    def create_decode_tables(self, codes):
         """
-        Function to remove the padding information that came with the encoded text.
+        Function that creates the lookup tables used by the decoder from a dictionary of codenames.
+        The main table is indexed by the next TABLE_BITS bits of the input and gives the symbol and
+        the length of the codename those bits start with. Longer codenames are kept per length.
         """
-        padded_info = bit_string[:8]
-        extra_padding = int(padded_info, 2)
+        self.table_symbols_list = list(codes.keys())
+        lengths = [len(code) for code in codes.values()]
+        values = [int(code, 2) for code in codes.values()]
 
-        bit_string = bit_string[8:]
-        encoded_text = bit_string[:-1 * extra_padding]
+        self.max_length = max(lengths) if len(lengths) > 0 else 0
+        if (self.max_length > 57):
+            raise ValueError("Codenames longer than 57 bits can not be decoded")
 
-        return encoded_text
-    
-    def decode_text(self, encoded_text):
+        self.table_bits = min(self.max_length, self.TABLE_BITS)
+        self.table_symbols = np.zeros(1 << self.table_bits, dtype=np.intp)
+        self.table_lengths = np.zeros(1 << self.table_bits, dtype=np.uint8)
+
+        long_codes = {}
+        for i in range(len(lengths)):
+            if (lengths[i] <= self.table_bits):
+                # every index that starts with the codename decodes to the same symbol
+                first = values[i] << (self.table_bits - lengths[i])
+                last = first + (1 << (self.table_bits - lengths[i]))
+                self.table_symbols[first:last] = i
+                self.table_lengths[first:last] = lengths[i]
+            else:
+                long_codes.setdefault(lengths[i], []).append((values[i], i))
+
+        # for each length longer than the table, the sorted codename values and their symbols
+        self.long_codes = {}
+        for length, pairs in long_codes.items():
+            pairs.sort()
+            self.long_codes[length] = (np.array([pair[0] for pair in pairs], dtype=np.uint64),
+                                       np.array([pair[1] for pair in pairs], dtype=np.intp))
+
+    def get_windows(self, buffer, n_bits, width, positions=None):
         """
-        Function used to decode the given encoded text and return it.
+        Function that returns the value of the `width` bits starting at each bit position of the byte buffer.
+        If positions is not given, the windows of all the positions 0...n_bits-1 are returned.
         """
-        current_code = ""
-        decoded_text = ""
-
-        # read the encoded text until a valid codename is found 
-        for bit in encoded_text:
-            current_code += bit
-            # when a valid codename is found, find its corresponding character from the dictionary and replace it with it
-            if (current_code in self.reverse_codes):
-                character = self.reverse_codes[current_code]
-                decoded_text += character
-                current_code = ""
-        
-        return decoded_text
-    
+        # the 64 bits starting at each byte of the buffer
+        padded = np.concatenate((buffer, np.zeros(8, dtype=np.uint8))).astype(np.uint64)
+        words = np.zeros(len(buffer), dtype=np.uint64)
+        for k in range(8):
+            words |= padded[k:k + len(buffer)] << np.uint64(56 - 8 * k)
+
+        if (positions is not None):
+            shift = (positions & 7).astype(np.uint64)
+            return (words[positions >> 3] << shift) >> np.uint64(64 - width)
+
+        # positions with the same offset inside their byte are shifted by the same amount
+        windows = np.zeros(len(buffer) * 8, dtype=np.uint64)
+        for shift in range(8):
+            windows[shift::8] = (words << np.uint64(shift)) >> np.uint64(64 - width)
+
+        return windows[:n_bits]
+
+    def lookup_positions(self, buffer, n_bits):
+        """
+        Function that looks up the symbol and the length of the codename that starts at each of the first
+        n_bits positions of the byte buffer. Positions where no codename starts get an invalid length.
+        """
+        windows = self.get_windows(buffer, n_bits, self.table_bits)
+        lengths = self.table_lengths[windows].astype(np.int64)
+        symbols = self.table_symbols[windows]
+
+        # the positions that start with a codename longer than the table are resolved using the full windows
+        long_positions = np.flatnonzero(lengths == 0)
+        if (len(long_positions) > 0 and len(self.long_codes) > 0):
+            full_windows = self.get_windows(buffer, n_bits, self.max_length, long_positions)
+            for length in sorted(self.long_codes):
+                values, indices = self.long_codes[length]
+                candidates = full_windows >> np.uint64(self.max_length - length)
+                found = np.minimum(np.searchsorted(values, candidates), len(values) - 1)
+                match = (values[found] == candidates) & (lengths[long_positions] == 0)
+                lengths[long_positions[match]] = length
+                symbols[long_positions[match]] = indices[found[match]]
+
+        lengths[lengths == 0] = self.INVALID_LENGTH
+
+        return lengths, symbols
+
+    def decode_positions(self, buffer, start, n_bits, stop):
+        """
+        Function that decodes the codenames of the byte buffer that start from bit `start` up to bit `stop`,
+        using the lookup tables. Only the first n_bits of the buffer are valid.
+        Returns the decoded symbols (as indices in table_symbols_list) and the position where decoding stopped.
+        """
+        decoded = []
+        position = start
+
+        while (position < stop):
+            # the lookups are done for a block of positions at a time, so that memory does not grow with the input
+            first = position - position % 8
+            last = min(first + self.DECODE_BLOCK_BITS, n_bits)
+            # the bytes of the block and enough bytes after them for the longest codename
+            lengths, symbols = self.lookup_positions(buffer[first // 8:(last + 7) // 8 + 8], last - first)
+
+            block_stop = min(stop, last) - first
+            current = position - first
+            starts = self.follow_codenames(lengths[:block_stop], current)
+
+            if (len(starts) > 0):
+                if (lengths[starts[-1]] == self.INVALID_LENGTH):
+                    raise ValueError("Invalid codename at bit " + str(first + int(starts[-1])))
+                # the next codename begins where the last one of the block ends
+                current = int(starts[-1] + lengths[starts[-1]])
+
+            decoded.append(symbols[starts])
+            position = first + current
+
+        if (len(decoded) == 0):
+            return np.zeros(0, dtype=np.intp), position
+
+        return np.concatenate(decoded), position
+
+    def follow_codenames(self, lengths, start):
+        """
+        Function that returns the positions where the codenames begin, from position `start`, each one beginning
+        where the previous one ended, given the length of the codename at every position (the positions past the
+        end, or where no codename starts, end the chain).
+        The chain is followed by pointer jumping: jumps[k] leads from any position to the one 2 ** k codenames
+        further, so only every (2 ** JUMP_LEVELS)-th start is visited one at a time, and the starts between them
+        are filled in with jumps[k] for every k, from the largest.
+        """
+        end = len(lengths)
+        if (start >= end):
+            return np.zeros(0, dtype=np.int64)
+
+        # the position past the end leads to itself
+        jump = np.empty(end + 1, dtype=np.int64)
+        np.minimum(np.arange(end) + lengths, end, out=jump[:end])
+        jump[end] = end
+
+        jumps = [jump]
+        for level in range(self.JUMP_LEVELS):
+            jumps.append(np.take(jumps[-1], jumps[-1]))
+
+        longest = jumps.pop()
+        current = start
+        starts = []
+        while (current < end):
+            starts.append(current)
+            current = int(longest[current])
+
+        starts = np.array(starts, dtype=np.int64)
+        for jump in reversed(jumps):
+            # a start is followed by the one jump leads to, which comes before the next start, so the order is kept
+            starts = np.stack((starts, np.take(jump, starts)), axis=1).ravel()
+            starts = starts[:np.searchsorted(starts, end)]
+
+        return starts
+
+    def decode_buffer(self, buffer, n_bits):
+        """
+        Function that decodes the first n_bits of the byte buffer using the lookup tables
+        and returns the array of the decoded symbols (as indices in table_symbols_list).
+        """
+        decoded, position = self.decode_positions(buffer, 0, n_bits, n_bits)
+
+        if (position != n_bits):
+            raise ValueError("The encoded data ends in the middle of a codename")
+
+        return decoded
+
+    def decode_bytes(self, data):
+        """
+        Function that removes the padding information from the encoded bytes and decodes them.
+        """
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        extra_padding = int(buffer[0])
+        n_bits = (len(buffer) - 1) * 8 - extra_padding
+
+        return self.decode_buffer(buffer[1:], n_bits)
+
     def decode(self, input_path):
         """
         Function that decodes the file given in the input_path using the above functions.
@@ -202,19 +417,548 @@ class HuffmanCoding:
         output_path = filename + "_decoded" + ".txt"
 
         with open(input_path, 'rb') as file, open(output_path, 'w') as output:
-            bit_string = ""
+            self.create_decode_tables(self.codes)
+            decoded = self.decode_bytes(file.read())
 
-            byte = file.read(1)
-            while (len(byte) > 0):
-                byte = ord(byte)
-                bits = bin(byte)[2:].rjust(8, '0')
-                bit_string += bits
-                byte = file.read(1)
-
-            encoded_text = self.remove_padding(bit_string)
-            decoded_text = self.decode_text(encoded_text)
+            decoded_text = "".join([self.table_symbols_list[i] for i in decoded.tolist()])
 
             output.write(decoded_text)
 
         print("Decoded!")
         return output_path
+
+    # FUNCTIONS USED FOR ENCODING AND DECODING NUMPY ARRAYS
+
+    def create_freq_array(self, array):
+        """
+        Function that creates the histogram of the values of an integer array.
+        The values are shifted so that the smallest one becomes 0 and can be used as an index.
+        Returns the shifted symbols and the frequency of each one of them, and keeps the offset of the first symbol.
+        """
+        symbols, frequency, self.offset = create_freq_array(array)
+
+        return symbols, frequency
+
+    def create_code_arrays(self, frequency):
+        """
+        Function that creates the codename lengths from a histogram and stores the length and the value
+        of the (canonical) codename of each symbol in two arrays indexed by the symbol.
+        """
+        self.create_canonical_codes(self.create_code_lengths(frequency, self.max_code_length))
+
+    def create_code_lengths(self, frequency, max_length=None):
+        """
+        Function that returns the length of the Huffman codename of each symbol of the histogram (0 for the
+        symbols that do not appear), without building a tree of nodes.
+        If max_length is given, no codename is longer than it (or than the fewest bits every symbol needs).
+        """
+        frequency = np.asarray(frequency, dtype=np.int64)
+        code_lengths = np.zeros(len(frequency), dtype=np.uint8)
+
+        used = np.flatnonzero(frequency)
+        if (len(used) == 0):
+            return code_lengths
+        if (len(used) == 1):
+            code_lengths[used] = 1
+            return code_lengths
+
+        # the symbols that appear, from the least to the most frequent
+        used = used[np.argsort(frequency[used], kind='stable')]
+        weights = frequency[used]
+
+        lengths = self.two_queue_lengths(weights)
+
+        if (max_length != None and lengths.max() > max_length):
+            max_length = max(max_length, math.ceil(math.log2(len(weights))))
+            lengths = self.package_merge_lengths(weights, max_length)
+
+        code_lengths[used] = lengths
+        return code_lengths
+
+    def two_queue_lengths(self, weights):
+        """
+        Function that returns the depth of each leaf of the Huffman tree for the sorted weights.
+        The merged nodes are created in increasing weight order, so the two smallest nodes are always
+        at the front of either the queue of leaves or the queue of merged nodes and no heap is needed.
+        """
+        n = len(weights)
+        weights = weights.tolist()
+
+        # nodes 0...n-1 are the leaves and n...2n-2 the merged nodes, in the order they are created
+        merged = []
+        parent = [0] * (2 * n - 1)
+        leaf, node = 0, 0
+
+        for new in range(n, 2 * n - 1):
+            children = []
+            for k in range(2):
+                if (node >= len(merged) or (leaf < n and weights[leaf] <= merged[node])):
+                    children.append((leaf, weights[leaf]))
+                    leaf += 1
+                else:
+                    children.append((n + node, merged[node]))
+                    node += 1
+
+            parent[children[0][0]] = new
+            parent[children[1][0]] = new
+            merged.append(children[0][1] + children[1][1])
+
+        # every node is created before its parent, so the depths can be found going backwards
+        depth = [0] * (2 * n - 1)
+        for i in range(2 * n - 3, -1, -1):
+            depth[i] = depth[parent[i]] + 1
+
+        return np.array(depth[:n], dtype=np.uint8)
+
+    def package_merge_lengths(self, weights, max_length):
+        """
+        Function that returns the optimal codename lengths of at most max_length bits for the sorted weights,
+        using the package-merge algorithm: at each level the items of the level below are paired into packages,
+        which are merged with the leaves. The length of a symbol is the number of levels its leaf is used in,
+        when the 2n-2 smallest items of the top level are selected.
+        """
+        n = len(weights)
+
+        # for each level, from the deepest to the top, which of its sorted items are leaves
+        is_leaf = [np.ones(n, dtype=bool)]
+        items = weights
+        for level in range(max_length - 1):
+            pairs = len(items) // 2
+            packages = items[0:2 * pairs:2] + items[1:2 * pairs:2]
+
+            merged = np.concatenate((weights, packages))
+            order = np.argsort(merged, kind='stable')
+            items = merged[order]
+            is_leaf.append(order < n)
+
+        lengths = np.zeros(n, dtype=np.int64)
+        selected = 2 * n - 2
+        for leaves in reversed(is_leaf):
+            # the leaves in the selection are always the lightest ones, as the items are sorted
+            selected_leaves = int(np.count_nonzero(leaves[:selected]))
+            lengths[:selected_leaves] += 1
+            # each selected package stands for two items of the level below
+            selected = 2 * (selected - selected_leaves)
+
+        return lengths.astype(np.uint8)
+
+    def create_canonical_codes(self, code_lengths):
+        """
+        Function that assigns the canonical codenames for the given codename lengths (indexed by symbol).
+        The symbols are sorted by length and then by value and each one gets the next available codename,
+        so the lengths alone are enough for the decoder to rebuild the same codes.
+        """
+        self.code_lengths = np.asarray(code_lengths, dtype=np.uint8)
+        self.code_values = np.zeros(len(self.code_lengths), dtype=np.uint64)
+        self.codes = {}
+        self.reverse_codes = {}
+
+        code = 0
+        previous_length = 0
+
+        for symbol in np.lexsort((np.arange(len(self.code_lengths)), self.code_lengths)).tolist():
+            length = int(self.code_lengths[symbol])
+            if (length == 0):
+                continue
+
+            code <<= length - previous_length
+            if (code >= (1 << length)):
+                raise ValueError("The codename lengths do not form a valid prefix code")
+
+            self.code_values[symbol] = code
+            codename = format(code, "0" + str(length) + "b")
+            self.codes[symbol] = codename
+            self.reverse_codes[codename] = symbol
+
+            code += 1
+            previous_length = length
+
+    def estimate_size(self, frequency):
+        """
+        Function that estimates the size in bytes of the encoded data and its code table, from the histogram alone.
+        The codes of the object are left as they are.
+        """
+        code_lengths = self.create_code_lengths(frequency, self.max_code_length)
+
+        bits = int(np.sum(np.asarray(frequency, dtype=np.int64) * code_lengths))
+
+        return bits // 8 + len(frequency)
+
+    def get_encoded_bytes(self, symbols):
+        """
+        Function that replaces every symbol with its codename and returns the codenames packed into bytes
+        (the last one padded with 0's) and the number of bits they take.
+        """
+        return pack_codes(self.code_values[symbols], self.code_lengths[symbols])
+
+    def get_padded_bytes(self, data, n_bits):
+        """
+        Add to the packed bits the same padding information as pad_encoded_text:
+        a first byte with the number of padding bits, followed by the bits padded with 0's.
+        """
+        extra_padding = 8 - n_bits % 8
+
+        packed = data.tobytes()
+        # the last byte is already padded, a full byte of padding has to be added by hand
+        if (extra_padding == 8):
+            packed += bytes(1)
+
+        return bytes([extra_padding]) + packed
+
+    def encode_array(self, array, zero_runs=False):
+        """
+        Encoding function for numpy arrays (e.g. a frame or a residual) - returns the encoded bytes.
+        The codes, the shape and the type of the array are kept so that decode_array can restore it.
+        If zero_runs is True, the runs of zeros are replaced by run symbols (see run_length.py) before the encoding.
+        """
+        array = np.asarray(array)
+        if (array.dtype.kind not in 'ui'):
+            raise ValueError("Only integer arrays can be encoded, got " + str(array.dtype))
+
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.zero_runs = zero_runs
+
+        values = encode_zero_runs(array) if zero_runs else array
+        symbols, frequency = self.create_freq_array(values)
+        self.create_code_arrays(frequency)
+
+        data, n_bits = self.get_encoded_bytes(symbols)
+
+        return self.get_padded_bytes(data, n_bits)
+
+    def decode_array(self, data, shape=None):
+        """
+        Decoding function for the bytes returned by encode_array - returns the decoded numpy array.
+        """
+        if (shape == None):
+            shape = self.shape
+
+        self.create_decode_tables(self.codes)
+        decoded = self.decode_bytes(data)
+
+        symbols = np.array(self.table_symbols_list, dtype=np.intp)[decoded] + self.offset
+        if (self.zero_runs):
+            symbols = decode_zero_runs(symbols)
+
+        return symbols.astype(self.dtype).reshape(shape)
+
+    # FUNCTIONS USED FOR THE SELF-DESCRIBING CONTAINER
+
+    def encode_container(self, array, code_lengths=None, offset=0, zero_runs=False):
+        """
+        Encoding function that returns the array in a container which can be decoded by any HuffmanCoding object.
+        The header holds the shape, the type, the canonical codename lengths, the number of symbols,
+        the padding and a CRC32 checksum of everything else.
+        If code_lengths (and the offset of the first symbol) are given, they are used instead of the array's own codes.
+        If zero_runs is True, the runs of zeros are replaced by run symbols (see run_length.py) before the encoding.
+        """
+        array = np.asarray(array)
+        if (array.dtype.kind not in 'ui'):
+            raise ValueError("Only integer arrays can be encoded, got " + str(array.dtype))
+
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.zero_runs = zero_runs
+
+        values = encode_zero_runs(array) if zero_runs else array
+
+        if (code_lengths is None):
+            symbols, frequency = self.create_freq_array(values)
+            self.create_code_arrays(frequency)
+        else:
+            self.offset = offset
+            self.create_canonical_codes(code_lengths)
+            symbols = values.ravel().astype(np.intp) - self.offset
+            self.check_symbols(symbols)
+
+        data, n_bits = self.get_encoded_bytes(symbols)
+        extra_padding = -n_bits % 8
+
+        header = self.get_container_header(len(symbols), extra_padding)
+        body = self.code_lengths.tobytes() + data.tobytes()
+        # the checksum covers the body first, so that a streaming encoder can fill in the header at the end
+        checksum = zlib.crc32(header, zlib.crc32(body))
+
+        return header + struct.pack("<I", checksum) + body
+
+    def check_symbols(self, symbols):
+        """
+        Function that makes sure that every symbol has a codename, when the codes were not built from the data itself.
+        """
+        if (len(symbols) > 0 and (symbols.min() < 0 or symbols.max() >= len(self.code_lengths)
+                                  or not self.code_lengths[symbols].all())):
+            raise ValueError("The data contains values that are not in the code table")
+
+    def get_container_header(self, symbol_count, extra_padding):
+        """
+        Function that packs the fields of the container header (everything before the checksum).
+        """
+        header = pack_array_header(self.CONTAINER_MAGIC, self.CONTAINER_VERSION, self.shape, self.dtype)
+        header += struct.pack("<qIQB", self.offset, len(self.code_lengths), symbol_count, extra_padding)
+        header += struct.pack("<B", self.FLAG_ZERO_RUNS if self.zero_runs else 0)
+
+        return header
+
+    def read_container_header(self, file):
+        """
+        Function that reads the header and the codename lengths of a container from an open file
+        and sets the shape, the type, the offset and the codes.
+        Returns the number of symbols, the padding, the checksum and the checksum of the bytes read.
+        """
+        self.shape, self.dtype, header = read_array_header(file, self.CONTAINER_MAGIC, self.CONTAINER_VERSION, "Huffman")
+
+        fields = read_exactly(file, struct.calcsize("<qIQB"))
+        self.offset, alphabet_size, symbol_count, extra_padding = struct.unpack("<qIQB", fields)
+        flags = read_exactly(file, 1)
+        self.zero_runs = (flags[0] & self.FLAG_ZERO_RUNS) != 0
+        header += fields + flags
+
+        (checksum,) = struct.unpack("<I", read_exactly(file, 4))
+
+        code_lengths = read_exactly(file, alphabet_size)
+        self.create_canonical_codes(np.frombuffer(code_lengths, dtype=np.uint8))
+
+        return symbol_count, extra_padding, checksum, header, zlib.crc32(code_lengths)
+
+    def decode_container(self, data):
+        """
+        Decoding function for the bytes returned by encode_container - returns the decoded numpy array.
+        No information from the encoder is needed, everything is rebuilt from the header.
+        """
+        file = io.BytesIO(data)
+        symbol_count, extra_padding, checksum, header, body_checksum = self.read_container_header(file)
+
+        payload = file.read()
+        if (zlib.crc32(header, zlib.crc32(payload, body_checksum)) != checksum):
+            raise ValueError("Checksum mismatch, the container is corrupted")
+
+        payload = np.frombuffer(payload, dtype=np.uint8)
+        n_bits = len(payload) * 8 - extra_padding
+
+        self.create_decode_tables(self.codes)
+        decoded = self.decode_buffer(payload, n_bits)
+        if (len(decoded) != symbol_count):
+            raise ValueError("Expected " + str(symbol_count) + " symbols, decoded " + str(len(decoded)))
+
+        symbols = np.array(self.table_symbols_list, dtype=np.intp)[decoded] + self.offset
+        if (self.zero_runs):
+            symbols = decode_zero_runs(symbols)
+
+        return symbols.astype(self.dtype).reshape(self.shape)
+
+    # FUNCTIONS USED FOR STREAMING (CHUNKED) ENCODING AND DECODING
+
+    def read_chunks(self, file, dtype, chunk_size):
+        """
+        Generator that reads a raw binary file in chunks of chunk_size values of the given type.
+        """
+        while True:
+            data = file.read(chunk_size * dtype.itemsize)
+            if (len(data) == 0):
+                return
+            if (len(data) % dtype.itemsize != 0):
+                raise ValueError("The size of the file is not a multiple of the size of " + str(dtype))
+            yield np.frombuffer(data, dtype=dtype)
+
+    def create_stream_histogram(self, input_path, dtype, chunk_size):
+        """
+        First pass of the streaming encoder - creates the histogram of the file one chunk at a time.
+        Returns the frequencies of the values between the smallest and the largest one, and the smallest value.
+        """
+        if (dtype.kind not in 'ui' or dtype.itemsize > 2):
+            raise ValueError("Streams of " + str(dtype) + " need a code table to be given")
+
+        # a bin for every value the type can hold
+        lowest = int(np.iinfo(dtype).min)
+        frequency = np.zeros(1 << (8 * dtype.itemsize), dtype=np.int64)
+
+        with open(input_path, 'rb') as file:
+            for values in self.read_chunks(file, dtype, chunk_size):
+                frequency += np.bincount(values.astype(np.intp) - lowest, minlength=len(frequency))
+
+        used = np.flatnonzero(frequency)
+        if (len(used) == 0):
+            return np.zeros(0, dtype=np.int64), 0
+
+        return frequency[used[0]:used[-1] + 1], lowest + int(used[0])
+
+    def encode_stream(self, input_path, output_path=None, dtype=np.uint8, chunk_size=1 << 20, code_lengths=None, offset=0):
+        """
+        Encoding function for raw binary files of any size, using memory that depends only on chunk_size.
+        The codes are built with a first pass over the file, unless code_lengths (and the offset of the
+        first symbol) are given. The output is a container that decode_container can also read.
+        """
+        if (output_path == None):
+            filename, file_extension = os.path.splitext(input_path)
+            output_path = filename + ".bin"
+
+        self.dtype = np.dtype(dtype)
+        if (code_lengths is None):
+            frequency, self.offset = self.create_stream_histogram(input_path, self.dtype, chunk_size)
+            self.create_code_arrays(frequency)
+        else:
+            self.offset = offset
+            self.create_canonical_codes(code_lengths)
+
+        # the number of symbols is not known yet, the header is written again at the end
+        self.shape = (0,)
+        self.zero_runs = False
+
+        with open(input_path, 'rb') as file, open(output_path, 'wb') as output:
+            output.write(self.get_container_header(0, 0) + struct.pack("<I", 0))
+
+            lengths = self.code_lengths.tobytes()
+            output.write(lengths)
+            writer = BitWriter(output, zlib.crc32(lengths))
+
+            symbol_count = 0
+            for values in self.read_chunks(file, self.dtype, chunk_size):
+                symbols = values.astype(np.intp) - self.offset
+                self.check_symbols(symbols)
+
+                writer.write(self.code_values[symbols], self.code_lengths[symbols])
+                symbol_count += len(symbols)
+
+            extra_padding = writer.flush()
+
+            self.shape = (symbol_count,)
+            header = self.get_container_header(symbol_count, extra_padding)
+            output.seek(0)
+            output.write(header + struct.pack("<I", zlib.crc32(header, writer.checksum)))
+
+        return output_path
+
+    def decode_stream(self, input_path, output_path=None, chunk_size=1 << 18):
+        """
+        Decoding function for containers of any size, reading chunk_size bytes at a time.
+        The decoded values are written in the output file as raw binary data.
+        """
+        if (output_path == None):
+            filename, file_extension = os.path.splitext(input_path)
+            output_path = filename + "_decoded" + ".raw"
+
+        with open(input_path, 'rb') as file, open(output_path, 'wb') as output:
+            symbol_count, extra_padding, checksum, header, body_checksum = self.read_container_header(file)
+            if (self.zero_runs):
+                raise ValueError("Containers with runs of zeros can only be decoded with decode_container")
+            self.create_decode_tables(self.codes)
+            symbols_list = np.array(self.table_symbols_list, dtype=np.intp)
+
+            payload_size = os.fstat(file.fileno()).st_size - file.tell()
+            reader = BitReader(file, payload_size * 8 - extra_padding, chunk_size, body_checksum)
+
+            decoded_count = 0
+            while (reader.fill()):
+                # keep the last bits for the next chunk, unless this is the last one, as a codename may continue there
+                stop = reader.n_bits if reader.finished else reader.n_bits - self.max_length
+                decoded, reader.start = self.decode_positions(reader.buffer, reader.start, reader.n_bits, stop)
+
+                values = (symbols_list[decoded] + self.offset).astype(self.dtype)
+                output.write(values.tobytes())
+                decoded_count += len(values)
+
+            if (reader.start != reader.n_bits):
+                raise ValueError("The encoded data ends in the middle of a codename")
+            if (zlib.crc32(header, reader.checksum) != checksum):
+                raise ValueError("Checksum mismatch, the container is corrupted")
+            if (decoded_count != symbol_count):
+                raise ValueError("Expected " + str(symbol_count) + " symbols, decoded " + str(decoded_count))
+
+        return output_path
+
+
+class BitWriter:
+    """
+    Class that packs the codenames of consecutive chunks into bytes and writes them in a file.
+    The bits that do not fill a whole byte are kept and written together with the next chunk.
+    """
+
+    def __init__(self, file, checksum=0):
+        self.file = file
+        # the leftover bits, as the value and the length of a codename
+        self.leftover_value = 0
+        self.leftover_length = 0
+        # CRC32 of everything written so far
+        self.checksum = checksum
+
+    def write_bytes(self, data):
+        """
+        Write the bytes in the file and update the checksum.
+        """
+        self.file.write(data)
+        self.checksum = zlib.crc32(data, self.checksum)
+
+    def write(self, values, lengths):
+        """
+        Write the whole bytes of the leftover bits followed by the given codenames (their values and lengths).
+        """
+        if (self.leftover_length > 0):
+            values = np.concatenate((np.array([self.leftover_value], dtype=np.uint64), values))
+            lengths = np.concatenate((np.array([self.leftover_length], dtype=np.int64), lengths))
+
+        data, n_bits = pack_codes(values, lengths)
+        whole = n_bits // 8
+
+        self.write_bytes(data[:whole].tobytes())
+        self.leftover_length = n_bits % 8
+        self.leftover_value = int(data[whole]) >> (8 - self.leftover_length) if self.leftover_length > 0 else 0
+
+    def flush(self):
+        """
+        Write the leftover bits padded with 0's and return how many 0's were added.
+        """
+        extra_padding = -self.leftover_length % 8
+        if (self.leftover_length > 0):
+            self.write_bytes(bytes([self.leftover_value << extra_padding]))
+        self.leftover_value = 0
+        self.leftover_length = 0
+
+        return extra_padding
+
+
+class BitReader:
+    """
+    Class that reads the payload of a file in chunks of bytes.
+    The buffer holds the bits that have not been decoded yet, starting from bit `start`,
+    and only its first n_bits are valid (the padding at the end of the file is excluded).
+    """
+
+    def __init__(self, file, total_bits, chunk_size, checksum=0):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.remaining_bits = total_bits
+        self.buffer = np.zeros(0, dtype=np.uint8)
+        self.start = 0
+        self.n_bits = 0
+        self.finished = False
+        # CRC32 of everything read so far
+        self.checksum = checksum
+
+    def fill(self):
+        """
+        Drop the bytes that have been decoded and read the next chunk.
+        Returns False when there is nothing left to read.
+        """
+        if (self.finished):
+            return False
+
+        dropped = self.start // 8
+        self.buffer = self.buffer[dropped:]
+        self.start -= 8 * dropped
+        self.n_bits -= 8 * dropped
+
+        data = self.file.read(self.chunk_size)
+        self.checksum = zlib.crc32(data, self.checksum)
+
+        new_bits = min(len(data) * 8, self.remaining_bits)
+        self.remaining_bits -= new_bits
+        self.n_bits += new_bits
+        self.buffer = np.concatenate((self.buffer, np.frombuffer(data, dtype=np.uint8)))
+
+        self.finished = len(data) < self.chunk_size or self.remaining_bits <= 0
+        if (self.finished):
+            # the rest of the file is only read for the checksum
+            self.checksum = zlib.crc32(self.file.read(), self.checksum)
+
+        return True
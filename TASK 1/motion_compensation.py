@@ -1,4 +1,24 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# SAD given to the candidate blocks that do not fit inside the frame
+INVALID_SAD = np.iinfo(np.int32).max
+
+# the supported fractions of a pixel of the motion vectors
+PRECISIONS = (1, 2, 4)
+
+# the block sizes of the variable block size partitions, largest first
+PARTITION_SIZES = (16, 8, 4)
+
+# the phases of predictive_search, each one a list of groups of macroblocks: the parity of their rows and columns
+# and the (row, column) steps to their neighbours that are tried as predictors, all found in earlier phases
+PREDICTIVE_PHASES = ((((0, 0), ()),),
+                     (((0, 1), ((0, -1), (0, 1))), ((1, 0), ((-1, 0), (1, 0)))),
+                     (((1, 1), ((0, -1), (-1, 0), (-1, 1))),))
+
+# the interpolated planes of the last reference frames, see get_subpel_planes
+SUBPEL_CACHE = {}
+SUBPEL_CACHE_SIZE = 4
 
 def divide_frame(frame):
     """
@@ -57,11 +77,13 @@ def get_block_zone(p, search_area, current_block):
 
 def find_mad(current_block, a_block):
     """
-    Returns Mean Absolute Difference between current_block and a_block.
+    Returns the Sum of Absolute Differences between current_block and a_block, which orders the blocks the same way
+    as their Mean Absolute Difference (all the blocks have the same size) without a float division.
+    The difference is taken in int16 so that the uint8 pixels do not wrap around.
     - current_block: current frame macroblock.
     - a_block: I-frame macroblock.
     """
-    return np.sum(np.abs(np.subtract(current_block, a_block)))/ (current_block.shape[0] * current_block.shape[1])
+    return np.abs(current_block.astype(np.int16) - a_block.astype(np.int16)).sum(dtype=np.int32)
 
 def find_match(current_block, search_area):
     """
@@ -73,7 +95,7 @@ def find_match(current_block, search_area):
     # find the center of the I-frame's search area
     sa_centerY, sa_centerX = int(sa_height/2), int(sa_width/2)
 
-    min_mad = float("+inf")
+    min_mad = INVALID_SAD
     minP = None
 
     while step >= 1:
@@ -108,38 +130,773 @@ def find_match(current_block, search_area):
 
     return match 
 
-def create_predicted(frame, target_frame):
+def get_pattern_offsets(steps=(4, 2, 1)):
     """
-    Helps create the predicted frame based on the initial I-frame and the target-frame.
+    Returns the offsets checked by find_match: the nine points around the center for each step size,
+    with the zero offset first.
+    """
+    offsets = [(0, 0)]
+    for step in steps:
+        for dy in (-step, 0, step):
+            for dx in (-step, 0, step):
+                if (dy, dx) not in offsets:
+                    offsets.append((dy, dx))
+
+    return offsets
+
+def get_block_grid(frame, block_size=16):
+    """
+    Returns the coordinates of the top left corner of every whole macroblock of the frame, as two arrays
+    of shape (vertical macroblocks, horizontal macroblocks).
     """
     height, width = frame.shape
-    vertical_mblocks, horizontal_mblocks = divide_frame(frame)
+    ys = np.arange(0, height - block_size + 1, block_size)
+    xs = np.arange(0, width - block_size + 1, block_size)
 
-    predicted = np.ones((height, width)) * 255
-    bcount = 0
+    return np.meshgrid(ys, xs, indexing="ij")
 
-    for y in range(0, int(vertical_mblocks * 16), 16):
-        for x in range(0, int(horizontal_mblocks * 16), 16):
-            bcount += 1
-            target_block = target_frame[y:y + 16, x:x + 16]
-            search_area = find_search_area(x, y, frame)
-            iframe_block = find_match(target_block, search_area)
-            
-            # add iframe_block to the predicted frame
-            predicted[y:y + 16, x:x + 16] = iframe_block
+def get_blocks(frame, ys, xs, block_size=16):
+    """
+    Returns the blocks of the frame whose top left corners are (ys, xs), as an array of shape
+    ys.shape + (block_size, block_size). Corners outside the frame are moved to the closest valid one.
+    """
+    height, width = frame.shape
+    windows = sliding_window_view(frame, (block_size, block_size))
 
-    assert bcount == int(horizontal_mblocks * vertical_mblocks)
+    return windows[np.clip(ys, 0, height - block_size), np.clip(xs, 0, width - block_size)]
+
+def block_sad(reference, target_blocks, ys, xs, bounds=None, rows=4):
+    """
+    Returns the Sum of Absolute Differences between every target block and the block of the reference frame
+    whose top left corner is (ys, xs), for all the blocks at once. Blocks that do not fit in the reference
+    frame get INVALID_SAD.
+    If bounds are given (for blocks given as one dimensional arrays), the SAD is added up a few rows at a time
+    and a block is dropped as soon as its partial SAD reaches its bound - the SAD returned for it is then only
+    a partial one, but it is still not smaller than its bound.
+    """
+    block_size = target_blocks.shape[-1]
+    height, width = reference.shape
+
+    valid = (ys >= 0) & (xs >= 0) & (ys <= height - block_size) & (xs <= width - block_size)
+
+    if bounds is None:
+        candidates = get_blocks(reference, ys, xs, block_size).astype(np.int16)
+        sad = np.abs(candidates - target_blocks).sum(axis=(-2, -1), dtype=np.int32)
+    else:
+        sad = np.zeros(len(ys), dtype=np.int32)
+        ys, xs = np.clip(ys, 0, height - block_size), np.clip(xs, 0, width - block_size)
+
+        # the blocks whose partial SAD is still below their bound
+        alive = np.flatnonzero(valid)
+        for row in range(0, block_size, rows):
+            count = min(rows, block_size - row)
+            windows = sliding_window_view(reference, (count, block_size))
+            candidates = windows[ys[alive] + row, xs[alive]].astype(np.int16)
+            sad[alive] += np.abs(candidates - target_blocks[alive, row:row + count]).sum(axis=(-2, -1), dtype=np.int32)
+            alive = alive[sad[alive] < bounds[alive]]
+
+    sad[~valid] = INVALID_SAD
+
+    return sad
+
+def interpolate_planes(frame, precision):
+    """
+    Returns the frame sampled at every 1 / precision of a pixel, as an array of shape (precision, precision,
+    height, width) where [fy, fx] holds the frame moved up by fy / precision and left by fx / precision pixels.
+    The samples are bilinear interpolations in integer arithmetic rounded to uint8, and the last row and column
+    are repeated past the edge of the frame.
+    """
+    height, width = frame.shape
+    padded = np.pad(frame, ((0, 1), (0, 1)), mode="edge").astype(np.int32)
+    top_left, top_right = padded[:-1, :-1], padded[:-1, 1:]
+    bottom_left, bottom_right = padded[1:, :-1], padded[1:, 1:]
+
+    planes = np.empty((precision, precision, height, width), dtype=np.uint8)
+    for fy in range(precision):
+        for fx in range(precision):
+            top = (precision - fx) * top_left + fx * top_right
+            bottom = (precision - fx) * bottom_left + fx * bottom_right
+            total = (precision - fy) * top + fy * bottom
+            planes[fy, fx] = (total + precision * precision // 2) // (precision * precision)
+
+    return planes
+
+def get_subpel_planes(frame, precision):
+    """
+    Returns the interpolated planes of the frame (see interpolate_planes) from a cache of the last reference frames,
+    so that a reference is interpolated once and not again for every block, search step or the decoder's prediction.
+    """
+    key = (frame.shape, precision, hash(frame.tobytes()))
+
+    cached = SUBPEL_CACHE.get(key)
+    if cached is not None and np.array_equal(cached[0], frame):
+        return cached[1]
+
+    if len(SUBPEL_CACHE) >= SUBPEL_CACHE_SIZE:
+        # drop the oldest reference
+        del SUBPEL_CACHE[next(iter(SUBPEL_CACHE))]
+
+    planes = interpolate_planes(frame, precision)
+    SUBPEL_CACHE[key] = (frame.copy(), planes)
+
+    return planes
+
+def get_subpel_blocks(planes, ys, xs, block_size=16):
+    """
+    Returns the blocks of the interpolated planes whose top left corners are (ys, xs), given in 1 / precision
+    of a pixel, as an array of shape ys.shape + (block_size, block_size). Corners outside the frame are moved
+    to the closest valid one.
+    """
+    precision, height, width = planes.shape[0], planes.shape[2], planes.shape[3]
+    windows = sliding_window_view(planes, (block_size, block_size), axis=(2, 3))
+
+    pixel_ys, fraction_ys = np.divmod(ys, precision)
+    pixel_xs, fraction_xs = np.divmod(xs, precision)
+
+    return windows[fraction_ys, fraction_xs, np.clip(pixel_ys, 0, height - block_size),
+                   np.clip(pixel_xs, 0, width - block_size)]
+
+def subpel_block_sad(planes, target_blocks, ys, xs):
+    """
+    Same as block_sad, with the interpolated planes of the reference frame and the corners (ys, xs) given in
+    1 / precision of a pixel.
+    """
+    block_size = target_blocks.shape[-1]
+    precision, height, width = planes.shape[0], planes.shape[2], planes.shape[3]
+
+    candidates = get_subpel_blocks(planes, ys, xs, block_size).astype(np.int16)
+    sad = np.abs(candidates - target_blocks).sum(axis=(-2, -1), dtype=np.int32)
+
+    valid = (ys >= 0) & (xs >= 0) & (ys <= (height - block_size) * precision) & (xs <= (width - block_size) * precision)
+    sad[~valid] = INVALID_SAD
+
+    return sad
+
+def refine_subpel(reference, target_blocks, ys, xs, vectors, sads, precision):
+    """
+    Refines the integer motion vectors (n, 2) of the blocks to 1 / precision of a pixel: the eight points at half
+    a pixel around each vector, then the eight points at a quarter of a pixel around the best one, and so on.
+    Returns the vectors in 1 / precision of a pixel, their SADs and the number of SAD evaluations.
+    """
+    planes = get_subpel_planes(reference, precision)
+
+    best_vectors = vectors * precision
+    best_sads = sads.copy()
+
+    evaluations = 0
+    step = precision // 2
+    while step >= 1:
+        centers = best_vectors.copy()
+        for dy, dx in SQUARE:
+            candidates = centers + (dy * step, dx * step)
+            sad = subpel_block_sad(planes, target_blocks, ys * precision + candidates[:, 0],
+                                   xs * precision + candidates[:, 1])
+            evaluations += int(np.count_nonzero(sad != INVALID_SAD))
+
+            better = sad < best_sads
+            best_sads[better] = sad[better]
+            best_vectors[better] = candidates[better]
+        step //= 2
+
+    return best_vectors, best_sads, evaluations
+
+def predict_from_vectors(frame, vectors, block_size=16, precision=1):
+    """
+    Builds the predicted frame (uint8) by copying, for every macroblock, the block of the reference frame its motion
+    vector points to. The pixels that do not belong to a whole macroblock are left white.
+    The vectors are given in 1 / precision of a pixel.
+    """
+    height, width = frame.shape
+    ys, xs = get_block_grid(frame, block_size)
+    vertical_mblocks, horizontal_mblocks = ys.shape
+
+    predicted = np.full((height, width), 255, dtype=np.uint8)
+    # a frame smaller than a macroblock stays white
+    if ys.size == 0:
+        return predicted
+
+    if precision == 1:
+        blocks = get_blocks(frame, ys + vectors[..., 0], xs + vectors[..., 1], block_size)
+    else:
+        planes = get_subpel_planes(frame, precision)
+        blocks = get_subpel_blocks(planes, ys * precision + vectors[..., 0], xs * precision + vectors[..., 1], block_size)
+
+    predicted[:vertical_mblocks * block_size, :horizontal_mblocks * block_size] = \
+        blocks.transpose(0, 2, 1, 3).reshape(vertical_mblocks * block_size, horizontal_mblocks * block_size)
 
     return predicted
 
+# search patterns, as (dy, dx) offsets around the current center
+SQUARE = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+LARGE_DIAMOND = [(-2, 0), (2, 0), (0, -2), (0, 2), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+SMALL_DIAMOND = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+LARGE_HEXAGON = [(0, -2), (0, 2), (-2, -1), (-2, 1), (2, -1), (2, 1)]
+
+def search_offsets(reference, target_blocks, ys, xs, search_range, centers, offsets, best_vectors, best_sads,
+                   blocks=None):
+    """
+    Evaluates the SAD of the given offsets around the center of each block (only for the listed blocks, or all
+    of them) and keeps the best vector and SAD of each block in best_vectors and best_sads.
+    Candidates farther than search_range from the block's own position are skipped.
+    Returns the number of SAD evaluations.
+    """
+    if blocks is None:
+        blocks = np.arange(len(ys))
+
+    evaluations = 0
+    for dy, dx in offsets:
+        vectors = centers[blocks] + (dy, dx)
+        in_range = np.abs(vectors).max(axis=1) <= search_range
+        selected, vectors = blocks[in_range], vectors[in_range]
+
+        # the candidates whose partial SAD reaches the best SAD so far are dropped early
+        sad = block_sad(reference, target_blocks[selected], ys[selected] + vectors[:, 0], xs[selected] + vectors[:, 1],
+                        best_sads[selected])
+        evaluations += int(np.count_nonzero(sad != INVALID_SAD))
+
+        # a candidate has to be strictly better, so the earlier ones win the ties
+        better = sad < best_sads[selected]
+        best_sads[selected[better]] = sad[better]
+        best_vectors[selected[better]] = vectors[better]
+
+    return evaluations
+
+def start_search(reference, target_blocks, ys, xs):
+    """
+    Evaluates the zero motion vector of every block, which is the starting point of all the strategies.
+    Returns the best vectors, their SADs and the number of SAD evaluations.
+    """
+    best_vectors = np.zeros((len(ys), 2), dtype=np.int64)
+    best_sads = block_sad(reference, target_blocks, ys, xs)
+
+    return best_vectors, best_sads, len(ys)
+
+def fixed_pattern_search(reference, target_blocks, ys, xs, search_range):
+    """
+    The search of find_match: the nine points of each step around the block's own position, without re-centering.
+    """
+    best_vectors, best_sads, evaluations = start_search(reference, target_blocks, ys, xs)
+    centers = np.zeros_like(best_vectors)
+
+    evaluations += search_offsets(reference, target_blocks, ys, xs, search_range, centers,
+                                  get_pattern_offsets()[1:], best_vectors, best_sads)
+
+    return best_vectors, best_sads, evaluations
+
+def get_full_offsets(search_range):
+    """
+    Returns every offset within search_range, the closest ones first (so the zero offset is the first one).
+    """
+    offsets = [(dy, dx) for dy in range(-search_range, search_range + 1) for dx in range(-search_range, search_range + 1)]
+    offsets.sort(key=lambda offset: (abs(offset[0]) + abs(offset[1]), offset))
+
+    return offsets
+
+def full_search(reference, target_blocks, ys, xs, search_range):
+    """
+    Exhaustive search: every offset within search_range, the closest ones first.
+    """
+    best_vectors, best_sads, evaluations = start_search(reference, target_blocks, ys, xs)
+    centers = np.zeros_like(best_vectors)
+
+    evaluations += search_offsets(reference, target_blocks, ys, xs, search_range, centers,
+                                  get_full_offsets(search_range)[1:], best_vectors, best_sads)
+
+    return best_vectors, best_sads, evaluations
+
+def three_step_search(reference, target_blocks, ys, xs, search_range):
+    """
+    Three step search: the eight points around the best point so far, with a step that starts at about half
+    the search range and is halved after each step, re-centering on the best point every time.
+    """
+    best_vectors, best_sads, evaluations = start_search(reference, target_blocks, ys, xs)
+
+    # the largest power of two not above about half the range: 4 for 7 or 8, 8 for 15 or 16
+    step = 1 << max(0, (search_range + 1).bit_length() - 2)
+    while step >= 1:
+        centers = best_vectors.copy()
+        offsets = [(dy * step, dx * step) for dy, dx in SQUARE]
+        evaluations += search_offsets(reference, target_blocks, ys, xs, search_range, centers, offsets,
+                                      best_vectors, best_sads)
+        step //= 2
+
+    return best_vectors, best_sads, evaluations
+
+def iterative_search(reference, target_blocks, ys, xs, search_range, large_pattern, small_pattern):
+    """
+    Moves the large pattern to its best point until the center is the best one for every block,
+    and then checks the small pattern once around the center.
+    """
+    best_vectors, best_sads, evaluations = start_search(reference, target_blocks, ys, xs)
+
+    # the blocks whose best point moved in the last iteration
+    active = np.arange(len(ys))
+    while len(active) > 0:
+        centers = best_vectors.copy()
+        evaluations += search_offsets(reference, target_blocks, ys, xs, search_range, centers, large_pattern,
+                                      best_vectors, best_sads, active)
+        active = active[np.any(best_vectors[active] != centers[active], axis=1)]
+
+    centers = best_vectors.copy()
+    evaluations += search_offsets(reference, target_blocks, ys, xs, search_range, centers, small_pattern,
+                                  best_vectors, best_sads)
+
+    return best_vectors, best_sads, evaluations
+
+def diamond_search(reference, target_blocks, ys, xs, search_range):
+    """
+    Diamond search: large diamond steps until the center is the best point, then one small diamond.
+    """
+    return iterative_search(reference, target_blocks, ys, xs, search_range, LARGE_DIAMOND, SMALL_DIAMOND)
+
+def hexagon_search(reference, target_blocks, ys, xs, search_range):
+    """
+    Hexagon search: large hexagon steps until the center is the best point, then one small diamond.
+    """
+    return iterative_search(reference, target_blocks, ys, xs, search_range, LARGE_HEXAGON, SMALL_DIAMOND)
+
+# the available motion search strategies - each one takes the reference frame, the target blocks (n, size, size),
+# the top left corners of the blocks (n,) and the search range, and returns the motion vectors (n, 2),
+# their SADs (n,) and the number of SAD evaluations it ran
+SEARCH_STRATEGIES = {
+    "fixed": fixed_pattern_search,
+    "full": full_search,
+    "three_step": three_step_search,
+    "diamond": diamond_search,
+    "hexagon": hexagon_search,
+}
+
+def downsample(frame):
+    """
+    Halves the size of a frame by averaging every 2x2 group of pixels (an odd last row or column is dropped).
+    """
+    height, width = frame.shape[0] // 2 * 2, frame.shape[1] // 2 * 2
+    pixels = frame[:height, :width].astype(np.uint16)
+
+    total = pixels[0::2, 0::2] + pixels[1::2, 0::2] + pixels[0::2, 1::2] + pixels[1::2, 1::2]
+
+    return ((total + 2) // 4).astype(np.uint8)
+
+def get_pyramid_seeds(coarse_vectors, ys, xs, height, width, block_size=16):
+    """
+    Returns the candidate starting vectors of every macroblock from the vectors of the level below (half the
+    resolution): the zero vector and the doubled vectors of the coarse macroblock covering it and of its eight
+    neighbours, since a coarse vector is often wrong near the edges of the frame where its block has no match.
+    The candidates are clipped so that the block stays inside the frame.
+    Returns an array of shape (candidates, vertical macroblocks, horizontal macroblocks, 2).
+    """
+    seeds = [np.zeros(ys.shape + (2,), dtype=np.int64)]
+    for row_step in (0, -1, 1):
+        for column_step in (0, -1, 1):
+            rows = np.clip(np.arange(ys.shape[0]) // 2 + row_step, 0, coarse_vectors.shape[0] - 1)
+            columns = np.clip(np.arange(ys.shape[1]) // 2 + column_step, 0, coarse_vectors.shape[1] - 1)
+            seeds.append(2 * coarse_vectors[rows][:, columns])
+
+    seeds = np.array(seeds)
+    seeds[..., 0] = np.clip(seeds[..., 0], -ys, height - block_size - ys)
+    seeds[..., 1] = np.clip(seeds[..., 1], -xs, width - block_size - xs)
+
+    return seeds
+
+def choose_seeds(reference, target_blocks, ys, xs, seeds):
+    """
+    Returns the candidate seed (see get_pyramid_seeds, flattened to (candidates, n, 2)) with the smallest SAD
+    for every block, its SAD and the number of SAD evaluations.
+    """
+    best_seeds = seeds[0].copy()
+    best_sads = block_sad(reference, target_blocks, ys + best_seeds[:, 0], xs + best_seeds[:, 1])
+    evaluations = int(np.count_nonzero(best_sads != INVALID_SAD))
+
+    for candidate in seeds[1:]:
+        sad = block_sad(reference, target_blocks, ys + candidate[:, 0], xs + candidate[:, 1], best_sads)
+        evaluations += int(np.count_nonzero(sad != INVALID_SAD))
+
+        better = sad < best_sads
+        best_sads[better] = sad[better]
+        best_seeds[better] = candidate[better]
+
+    return best_seeds, best_sads, evaluations
+
+def get_neighbour_vectors(vectors, rows, columns, steps):
+    """
+    Returns the vectors of the neighbours of the given macroblocks at the given (row, column) steps, followed by
+    their component-wise median when there are three of them, as an array of shape (candidates, blocks, 2).
+    Neighbours outside the frame count as zero vectors.
+    """
+    vertical_mblocks, horizontal_mblocks = vectors.shape[:2]
+
+    neighbours = []
+    for row_step, column_step in steps:
+        neighbour_rows, neighbour_columns = rows + row_step, columns + column_step
+        inside = ((neighbour_rows >= 0) & (neighbour_rows < vertical_mblocks) & (neighbour_columns >= 0)
+                  & (neighbour_columns < horizontal_mblocks))
+
+        neighbour = np.zeros((len(rows), 2), dtype=np.int64)
+        neighbour[inside] = vectors[neighbour_rows[inside], neighbour_columns[inside]]
+        neighbours.append(neighbour)
+
+    if len(neighbours) == 3:
+        neighbours.append(np.sort(np.array(neighbours), axis=0)[1])
+
+    return np.array(neighbours).reshape(len(neighbours), len(rows), 2)
+
+def predictive_search(reference, target_blocks, ys, xs, strategy, search_range, threshold, seeds=None):
+    """
+    Searches the macroblocks starting from predicted vectors, and stops early for the blocks whose prediction
+    is good enough.
+    threshold is a mean absolute difference per pixel, so that it means the same for every block size.
+    First the zero vector and the given seeds (candidates, n, 2), if any, are tried for all the blocks at once:
+    the blocks whose best seed is below threshold stop there, which on a still scene is most of them.
+    The other blocks are searched in the three phases of PREDICTIVE_PHASES, by parity of their row and column, all
+    the blocks of a phase at once. The blocks of even rows and columns are searched first. Then those of even rows
+    and odd columns try the vectors of their left and right neighbours, and those of odd rows and even columns the
+    vectors of their top and bottom neighbours. Last, the blocks of odd rows and columns try the vectors of their
+    left, top and top right neighbours and their median. Those still above threshold are searched around their best
+    predictor with the given strategy. So there are only three searches, whatever the size of the frame, and where
+    the motion is smooth only the blocks of the first phase are searched.
+    ys and xs are the grids of the macroblocks' corners and the target blocks are flattened, as is the output:
+    the vectors (n, 2), their SADs (n,) and the number of SAD evaluations.
+    """
+    candidates = [np.zeros((ys.size, 2), dtype=np.int64)]
+    if seeds is not None:
+        candidates.extend(seeds)
+
+    best_seeds, best_sads, evaluations = choose_seeds(reference, target_blocks, ys.ravel(), xs.ravel(),
+                                                      np.array(candidates))
+    # views of the flat results, by macroblock
+    vectors = best_seeds.reshape(ys.shape + (2,))
+    sads = best_sads.reshape(ys.shape)
+
+    # the threshold of the SAD of a whole block
+    limit = threshold * target_blocks.shape[1] * target_blocks.shape[2]
+
+    remaining = sads >= limit
+    for phase in PREDICTIVE_PHASES:
+        rows, columns, predictors = [], [], []
+        for (first_row, first_column), steps in phase:
+            group_rows, group_columns = np.nonzero(remaining[first_row::2, first_column::2])
+            group_rows, group_columns = group_rows * 2 + first_row, group_columns * 2 + first_column
+            rows.append(group_rows)
+            columns.append(group_columns)
+            predictors.append(get_neighbour_vectors(vectors, group_rows, group_columns, steps))
+
+        rows, columns, predictors = np.concatenate(rows), np.concatenate(columns), np.concatenate(predictors, axis=1)
+        if len(rows) == 0:
+            continue
+        blocks = rows * ys.shape[1] + columns
+        batch_ys, batch_xs = ys[rows, columns], xs[rows, columns]
+        batch_vectors, batch_sads = vectors[rows, columns], sads[rows, columns]
+
+        for candidate in predictors:
+            # neighbours often share their vector, which is then only tried once
+            tried = np.flatnonzero(np.any(candidate != batch_vectors, axis=1))
+            sad = block_sad(reference, target_blocks[blocks[tried]], batch_ys[tried] + candidate[tried, 0],
+                            batch_xs[tried] + candidate[tried, 1], batch_sads[tried])
+            evaluations += int(np.count_nonzero(sad != INVALID_SAD))
+
+            improved = sad < batch_sads[tried]
+            better = tried[improved]
+            batch_sads[better] = sad[improved]
+            batch_vectors[better] = candidate[better]
+
+        # early termination: the blocks whose predictor is good enough are not searched
+        searched = np.flatnonzero(batch_sads >= limit)
+        if len(searched) > 0:
+            found, found_sads, count = SEARCH_STRATEGIES[strategy](
+                reference, target_blocks[blocks[searched]], batch_ys[searched] + batch_vectors[searched, 0],
+                batch_xs[searched] + batch_vectors[searched, 1], search_range)
+            evaluations += count
+
+            batch_vectors[searched] += found
+            batch_sads[searched] = found_sads
+
+        vectors[rows, columns] = batch_vectors
+        sads[rows, columns] = batch_sads
+
+    return best_seeds, best_sads, evaluations
+
+def estimate_motion(frame, target_frame, strategy="three_step", search_range=7, block_size=16, levels=0,
+                    predictive=False, threshold=2, precision=1):
+    """
+    Finds the motion vector of every macroblock of the target frame with the given search strategy.
+    All the macroblocks are searched at once, one candidate offset at a time.
+    With levels > 0 the motion is first estimated on frames downsampled levels times (coarse to fine): the vectors
+    of every level, doubled, seed the searches of the next one. The coarsest level has to see the motion within its
+    own search range, so motion of up to about search_range * 2 ** levels pixels is found reliably, for the cost
+    of levels + 1 small searches.
+    Levels whose frames would be smaller than a macroblock are skipped.
+    With predictive, the blocks are also seeded with the vectors of their neighbours and the search stops at
+    any seed whose mean absolute difference per pixel is below threshold (see predictive_search).
+    With a precision of 2 or 4 the integer vectors are refined to half or quarter pixels (see refine_subpel).
+    Returns the motion vectors, an array of shape (vertical macroblocks, horizontal macroblocks, 2) holding (dy, dx)
+    in 1 / precision of a pixel, their SADs and the number of SAD evaluations.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError("Unknown search strategy " + str(strategy))
+    if precision not in PRECISIONS:
+        raise ValueError("Unsupported motion vector precision " + str(precision))
+
+    height, width = target_frame.shape
+    ys, xs = get_block_grid(target_frame, block_size)
+    # a frame smaller than a macroblock has nothing to search
+    if ys.size == 0:
+        return np.zeros(ys.shape + (2,), dtype=np.int64), np.zeros(ys.shape, dtype=np.int32), 0
+
+    target_blocks = get_blocks(target_frame, ys, xs, block_size).astype(np.int16).reshape(-1, block_size, block_size)
+
+    evaluations = 0
+    candidates = None
+    if levels > 0 and min(height, width) // 2 >= block_size:
+        coarse_vectors, coarse_sads, evaluations = estimate_motion(downsample(frame), downsample(target_frame), strategy,
+                                                                   search_range, block_size, levels - 1, predictive,
+                                                                   threshold)
+        candidates = get_pyramid_seeds(coarse_vectors, ys, xs, height, width, block_size)
+        candidates = candidates.reshape(len(candidates), -1, 2)
+
+    if predictive:
+        vectors, sads, count = predictive_search(frame, target_blocks, ys, xs, strategy, search_range, threshold,
+                                                 candidates)
+        evaluations += count
+    else:
+        seeds = np.zeros((ys.size, 2), dtype=np.int64)
+        if candidates is not None:
+            seeds, seed_sads, count = choose_seeds(frame, target_blocks, ys.ravel(), xs.ravel(), candidates)
+            evaluations += count
+
+        # the search runs around the seeds by moving the blocks' positions to them
+        vectors, sads, count = SEARCH_STRATEGIES[strategy](frame, target_blocks, ys.ravel() + seeds[:, 0],
+                                                           xs.ravel() + seeds[:, 1], search_range)
+        vectors += seeds
+        evaluations += count
+
+    if precision > 1:
+        vectors, sads, count = refine_subpel(frame, target_blocks, ys.ravel(), xs.ravel(), vectors, sads, precision)
+        evaluations += count
+
+    return vectors.reshape(ys.shape + (2,)), sads.reshape(ys.shape), evaluations
+
+def block_matching(frame, target_frame, strategy="three_step", search_range=7, block_size=16, levels=0,
+                   predictive=False, threshold=2, precision=1):
+    """
+    Finds the motion vectors of the macroblocks of the target frame and builds the predicted frame.
+    Returns the motion vectors (see estimate_motion) and the predicted frame.
+    """
+    vectors, sads, evaluations = estimate_motion(frame, target_frame, strategy, search_range, block_size, levels,
+                                                 predictive, threshold, precision)
+
+    return vectors, predict_from_vectors(frame, vectors, block_size, precision)
+
+def create_predicted(frame, target_frame, strategy="three_step", search_range=7, levels=0, predictive=False,
+                     threshold=2, precision=1):
+    """
+    Helps create the predicted frame based on the initial I-frame and the target-frame.
+    """
+    vectors, predicted = block_matching(frame, target_frame, strategy, search_range, levels=levels,
+                                        predictive=predictive, threshold=threshold, precision=precision)
+
+    return predicted
+
+def pad_frame(frame, block_size=16):
+    """
+    Pads the frame to a multiple of block_size in both dimensions by repeating its last row and column.
+    """
+    height, width = frame.shape
+
+    return np.pad(frame, ((0, -height % block_size), (0, -width % block_size)), mode="edge")
+
+def tile_sads(reference, target_frame, dy, dx, tile_size=4):
+    """
+    Returns the SAD of every tile_size x tile_size tile of the target frame against the reference frame moved
+    by (dy, dx), as an int32 array of shape (height / tile_size, width / tile_size). The frames must have the same
+    shape, a multiple of tile_size. Tiles whose match is not entirely inside the reference get INVALID_SAD.
+    """
+    height, width = target_frame.shape
+    top, bottom = max(0, -dy), min(height, height - dy)
+    left, right = max(0, -dx), min(width, width - dx)
+
+    difference = np.zeros((height, width), dtype=np.int16)
+    if top < bottom and left < right:
+        difference[top:bottom, left:right] = np.abs(target_frame[top:bottom, left:right].astype(np.int16)
+                                                    - reference[top + dy:bottom + dy, left + dx:right + dx])
+
+    # adding up the rows and then the columns of the tiles is much faster than one sum over a 4d view
+    rows = difference[0::tile_size].astype(np.int32)
+    for row in range(1, tile_size):
+        rows += difference[row::tile_size]
+    sads = rows[:, 0::tile_size].copy()
+    for column in range(1, tile_size):
+        sads += rows[:, column::tile_size]
+
+    mark_invalid_tiles(sads, dy, dx, tile_size, height, width)
+
+    return sads
+
+def mark_invalid_tiles(sads, dy, dx, tile_size, height, width):
+    """
+    Sets INVALID_SAD for the tiles of the SAD map whose match, moved by (dy, dx), is not inside the frame.
+    """
+    tile_ys = np.arange(sads.shape[0]) * tile_size + dy
+    tile_xs = np.arange(sads.shape[1]) * tile_size + dx
+
+    sads[(tile_ys < 0) | (tile_ys > height - tile_size), :] = INVALID_SAD
+    sads[:, (tile_xs < 0) | (tile_xs > width - tile_size)] = INVALID_SAD
+
+def merge_tiles(sads):
+    """
+    Returns the SADs of the blocks made of 2x2 tiles of the SAD map, by adding the SADs of the tiles
+    (in the type of the map).
+    """
+    return sads[0::2, 0::2] + sads[1::2, 0::2] + sads[0::2, 1::2] + sads[1::2, 1::2]
+
+def choose_partitions(best_sads, split_penalty):
+    """
+    Chooses, bottom up, whether every 8x8 block is split in 4x4 blocks and every 16x16 block in 8x8 blocks:
+    a block is split when the costs of its parts add up to less than its own cost, the cost of a block being
+    its SAD plus split_penalty (the price of one more motion vector).
+    Returns the size of the partition covering every 8x8 block of the frame.
+    """
+    costs = {size: best_sads[size].astype(np.int64) + split_penalty for size in PARTITION_SIZES}
+
+    split_8 = merge_tiles(costs[4]) < costs[8]
+    costs[8] = np.where(split_8, merge_tiles(costs[4]), costs[8])
+    split_16 = merge_tiles(costs[8]) < costs[16]
+
+    sizes = np.where(split_8, 4, 8)
+    sizes[np.repeat(np.repeat(~split_16, 2, axis=0), 2, axis=1)] = 16
+
+    return sizes.astype(np.uint8)
+
+def get_tile_steps(sizes):
+    """
+    Returns, for every 4x4 tile of the frame, the size of its partition measured in tiles.
+    """
+    return np.repeat(np.repeat(sizes // 4, 2, axis=0), 2, axis=1)
+
+def get_partition_order(shape):
+    """
+    Returns the indices of the 4x4 tiles of a frame (shape, in tiles) in the order the partitions are stored:
+    16x16 blocks in raster order, the 8x8 blocks of each in raster order and the 4x4 blocks of each in raster order.
+    """
+    rows, columns = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    keys = (columns % 2, rows % 2, columns // 2 % 2, rows // 2 % 2, columns // 4, rows // 4)
+
+    return np.lexsort([key.ravel() for key in keys])
+
+def get_partition_vectors(sizes, field):
+    """
+    Returns the motion vectors of the partitions, one per partition in the order of get_partition_order,
+    from the field holding the motion vector of every 4x4 tile.
+    """
+    steps = get_tile_steps(sizes)
+    rows, columns = np.indices(steps.shape)
+    # the top left tile of every partition holds its vector
+    first = ((rows % steps == 0) & (columns % steps == 0)).ravel()
+
+    order = get_partition_order(steps.shape)
+
+    return field.reshape(-1, 2)[order[first[order]]]
+
+def get_vector_field(sizes, vectors):
+    """
+    Rebuilds the motion vector of every 4x4 tile from the vectors returned by get_partition_vectors.
+    """
+    steps = get_tile_steps(sizes)
+    rows, columns = np.indices(steps.shape)
+    first = ((rows % steps == 0) & (columns % steps == 0)).ravel()
+
+    order = get_partition_order(steps.shape)
+    if len(vectors) != np.count_nonzero(first):
+        raise ValueError("The motion vectors do not match the partitions")
+
+    field = np.zeros((steps.size, 2), dtype=np.int64)
+    field[order[first[order]]] = vectors
+    field = field.reshape(steps.shape + (2,))
+
+    # every other tile copies the vector of the top left tile of its partition
+    return field[rows - rows % steps, columns - columns % steps]
+
+def partition_motion(frame, target_frame, search_range=7, split_penalty=16, precision=1):
+    """
+    Variable block size motion estimation: every 16x16 macroblock may be split in 8x8 blocks, and every 8x8 block
+    in 4x4 blocks, when that lowers the cost (see choose_partitions).
+    The frames are padded to a multiple of 16 so that their edges are predicted too. Every offset within
+    search_range is checked: the SADs of the 4x4 tiles of the whole frame are computed once per offset and added up
+    for the 8x8 and 16x16 blocks instead of being computed again. The best vector of every block is refined to
+    1 / precision of a pixel (see refine_subpel) before the partitions are chosen.
+    Returns the size of the partition covering every 8x8 block of the padded frame, the motion vector of every 4x4
+    tile (in 1 / precision of a pixel) and the number of 4x4 SAD evaluations.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("Unsupported motion vector precision " + str(precision))
+
+    reference, target_frame = pad_frame(frame), pad_frame(target_frame)
+    height, width = target_frame.shape
+
+    best_vectors = {size: np.zeros((height // size, width // size, 2), dtype=np.int64) for size in PARTITION_SIZES}
+    best_sads = {size: np.full((height // size, width // size), INVALID_SAD, dtype=np.int32) for size in PARTITION_SIZES}
+
+    evaluations = 0
+    for dy, dx in get_full_offsets(search_range):
+        sads = {4: tile_sads(reference, target_frame, dy, dx)}
+        evaluations += int(np.count_nonzero(sads[4] != INVALID_SAD))
+
+        # the tiles outside the frame have to be marked again, their INVALID_SAD does not survive the sums
+        sads[8] = merge_tiles(np.minimum(sads[4], INVALID_SAD // 4))
+        mark_invalid_tiles(sads[8], dy, dx, 8, height, width)
+        sads[16] = merge_tiles(np.minimum(sads[8], INVALID_SAD // 4))
+        mark_invalid_tiles(sads[16], dy, dx, 16, height, width)
+
+        for size in PARTITION_SIZES:
+            better = sads[size] < best_sads[size]
+            best_sads[size][better] = sads[size][better]
+            best_vectors[size][better] = (dy, dx)
+
+    if precision > 1:
+        for size in PARTITION_SIZES:
+            ys, xs = get_block_grid(target_frame, size)
+            target_blocks = get_blocks(target_frame, ys, xs, size).astype(np.int16).reshape(-1, size, size)
+            vectors, sads, count = refine_subpel(reference, target_blocks, ys.ravel(), xs.ravel(),
+                                                 best_vectors[size].reshape(-1, 2), best_sads[size].ravel(), precision)
+            best_vectors[size], best_sads[size] = vectors.reshape(ys.shape + (2,)), sads.reshape(ys.shape)
+            evaluations += count
+
+    sizes = choose_partitions(best_sads, split_penalty)
+
+    # the vector of every 4x4 tile, taken from the size of its partition
+    tile_sizes = np.repeat(np.repeat(sizes, 2, axis=0), 2, axis=1)
+    field = best_vectors[4].copy()
+    for size in (8, 16):
+        repeated = np.repeat(np.repeat(best_vectors[size], size // 4, axis=0), size // 4, axis=1)
+        field[tile_sizes == size] = repeated[tile_sizes == size]
+
+    return sizes, field, evaluations
+
+def predict_from_field(frame, field, precision=1):
+    """
+    Builds the predicted frame (uint8) from the motion vector of every 4x4 tile of the padded frame
+    (see partition_motion), and crops it back to the size of the frame.
+    """
+    height, width = frame.shape
+    reference = pad_frame(frame)
+
+    ys, xs = get_block_grid(reference, 4)
+    planes = get_subpel_planes(reference, precision) if precision > 1 else reference[None, None]
+    blocks = get_subpel_blocks(planes, ys * precision + field[..., 0], xs * precision + field[..., 1], 4)
+
+    predicted = blocks.transpose(0, 2, 1, 3).reshape(reference.shape)
+
+    return predicted[:height, :width]
+
 def find_residual(target_frame, predicted_frame):
     """
-    Find the residual frame via target_frame - predicted_frame.
+    Find the residual frame via target_frame - predicted_frame, as int16 so that it holds the negative differences.
     """
-    return np.subtract(target_frame, predicted_frame)
+    return np.subtract(target_frame, predicted_frame, dtype=np.int16)
 
 def reconstruct_target(residual_frame, predicted_frame):
     """
-    Reconstruct the target frame by adding the residual_frame to the predicted_frame.
+    Reconstruct the target frame (uint8) by adding the residual_frame to the predicted_frame.
     """
-    return np.add(residual_frame, predicted_frame)
+    reconstructed_frame = np.add(residual_frame, predicted_frame, dtype=np.int16)
+
+    return np.clip(reconstructed_frame, 0, 255).astype(np.uint8)
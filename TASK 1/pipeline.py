@@ -0,0 +1,226 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+class Stage:
+    """
+    A step of a pipeline: a function applied to every item that comes out of the previous step.
+
+    The items are handled by `workers` threads at once or, with processes, by a pool of `workers` processes
+    (the function and the items then have to be picklable). With ordered, the items are handled one at a time
+    in the order of the source, which is what a stage that writes its items one after the other needs.
+    """
+
+    def __init__(self, name, function, workers=1, processes=False, ordered=False):
+        self.name = name
+        self.function = function
+        self.workers = 1 if ordered else workers
+        self.processes = processes
+        self.ordered = ordered
+
+class Pipeline:
+    """
+    Runs the items of a source through a list of stages, with every stage working at the same time as the others:
+    while an item is being written, the next ones are computed and the ones after them are read.
+
+    The stages are linked by queues of queue_size items, so a slow stage makes the ones before it wait instead of
+    piling up items in memory (backpressure). The results come out in the order of the source.
+    The time every stage spends working is kept in stats, to find the stage that limits the throughput.
+    """
+
+    # marks the end of the items in a queue
+    DONE = object()
+    # how often a blocked thread checks whether the pipeline was stopped
+    POLL_SECONDS = 0.1
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def put(self, items, item):
+        """
+        Function that puts an item in a queue, waiting while the queue is full - returns False if the pipeline
+        was stopped meanwhile.
+        """
+        while not self.stop.is_set():
+            try:
+                items.put(item, timeout=self.POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def get(self, items):
+        """
+        Function that takes an item from a queue, waiting while the queue is empty - returns DONE if the pipeline
+        was stopped meanwhile.
+        """
+        while not self.stop.is_set():
+            try:
+                return items.get(timeout=self.POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+        return self.DONE
+
+    def add_busy(self, name, seconds):
+        with self.lock:
+            self.stats[name]["busy"] += seconds
+            self.stats[name]["items"] += 1
+
+    def fail(self, error):
+        """
+        Function that keeps the first error raised by a stage and stops the pipeline.
+        """
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+    def read_source(self, source, output):
+        """
+        Function that moves the items of the source to the first queue, numbered in their order.
+        """
+        try:
+            iterator = iter(source)
+            number = 0
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.add_busy("source", time.perf_counter() - start)
+
+                # the items in flight are limited, so that the reordering buffers stay small too
+                while not self.in_flight.acquire(timeout=self.POLL_SECONDS):
+                    if self.stop.is_set():
+                        return
+                if not self.put(output, (number, item)):
+                    return
+                number += 1
+        except BaseException as error:
+            self.fail(error)
+        finally:
+            self.put(output, self.DONE)
+
+    def run_stage(self, stage, pool, state, inputs, output):
+        """
+        Function run by every worker thread of a stage: applies the stage to the items of its input queue.
+        """
+        try:
+            while True:
+                item = self.get(inputs)
+                if item is self.DONE:
+                    # let the other workers of the stage see the end too
+                    self.put(inputs, self.DONE)
+                    break
+
+                number, value = item
+                if stage.ordered:
+                    # keep the items that come early until it is their turn
+                    state["waiting"][number] = value
+                    while state["next"] in state["waiting"]:
+                        if not self.handle(stage, pool, state["next"], state["waiting"].pop(state["next"]), output):
+                            return
+                        state["next"] += 1
+                elif not self.handle(stage, pool, number, value, output):
+                    return
+        except BaseException as error:
+            self.fail(error)
+        finally:
+            with self.lock:
+                state["running"] -= 1
+                last = state["running"] == 0
+            # the last worker of the stage to finish tells the next stage
+            if last:
+                self.put(output, self.DONE)
+
+    def handle(self, stage, pool, number, value, output):
+        """
+        Function that applies the stage to an item and passes the result on - returns False if the pipeline stopped.
+        """
+        start = time.perf_counter()
+        if pool is not None:
+            result = pool.submit(stage.function, value).result()
+        else:
+            result = stage.function(value)
+        self.add_busy(stage.name, time.perf_counter() - start)
+
+        return self.put(output, (number, result))
+
+    def run(self, source):
+        """
+        Generator that yields the result of the stages for every item of the source, in the order of the source.
+        The stats are reset and kept up to date while it runs.
+        """
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.error = None
+        self.in_flight = threading.Semaphore(self.queue_size * (len(self.stages) + 1)
+                                             + sum(stage.workers for stage in self.stages))
+        self.stats = {"source": {"workers": 1, "busy": 0.0, "items": 0}}
+        for stage in self.stages:
+            self.stats[stage.name] = {"workers": stage.workers, "busy": 0.0, "items": 0}
+
+        queues = [queue.Queue(self.queue_size) for i in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.read_source, args=(source, queues[0]), daemon=True)]
+        pools = []
+
+        for i, stage in enumerate(self.stages):
+            pool = ProcessPoolExecutor(max_workers=stage.workers) if stage.processes else None
+            if pool is not None:
+                pools.append(pool)
+            state = {"running": stage.workers, "next": 0, "waiting": {}}
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=self.run_stage, args=(stage, pool, state, queues[i],
+                                                                             queues[i + 1]), daemon=True))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            # the results may come out of order when a stage has several workers
+            waiting = {}
+            next_number = 0
+            while True:
+                item = self.get(queues[-1])
+                if item is self.DONE:
+                    break
+                number, result = item
+                waiting[number] = result
+                while next_number in waiting:
+                    yield waiting.pop(next_number)
+                    self.in_flight.release()
+                    next_number += 1
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                pool.shutdown()
+
+            elapsed = time.perf_counter() - start
+            for name in self.stats:
+                self.stats[name]["seconds"] = elapsed
+                self.stats[name]["utilization"] = (self.stats[name]["busy"] / (elapsed * self.stats[name]["workers"])
+                                                   if elapsed > 0 else 0.0)
+
+        if self.error is not None:
+            raise self.error
+
+    def report(self):
+        """
+        Function that returns the stats of the last run as text, one line per stage. The stage closest to 100%
+        busy is the one that limits the throughput.
+        """
+        lines = []
+        for name, stats in self.stats.items():
+            lines.append("{:<10} {:>5} items  {:>8.3f} s busy  {:>3} workers  {:>6.1%} busy".format(
+                name, stats["items"], stats["busy"], stats["workers"], stats.get("utilization", 0.0)))
+
+        return "\n".join(lines)
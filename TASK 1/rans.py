@@ -0,0 +1,274 @@
+import io
+import math
+import struct
+import zlib
+import numpy as np
+from run_length import encode_zero_runs, decode_zero_runs
+from entropy import create_freq_array, read_exactly, pack_array_header, read_array_header
+
+class RansCoding:
+    """
+    Entropy coder based on rANS (range asymmetric numeral systems), with the same interface as HuffmanCoding
+    for numpy arrays. Unlike Huffman coding it can spend less than one bit on a very frequent symbol.
+
+    The symbols are split in up to `lanes` interleaved streams (symbol i goes to lane i % lanes) which are all
+    encoded and decoded at the same time with numpy operations, one symbol per lane at a time.
+    """
+
+    # short inputs use fewer lanes, as the final state of every lane has to be stored
+    SYMBOLS_PER_LANE = 256
+
+    # the state of each lane is kept in [STATE_LOW, STATE_LOW << 16) and 16 bits are moved at a time
+    STATE_LOW = 1 << 16
+
+    # the frequencies are scaled so that they add up to 2^prob_bits
+    MIN_PROB_BITS = 12
+    MAX_PROB_BITS = 15
+
+    # identification of the container written by encode_container
+    CONTAINER_MAGIC = b"RANS"
+    CONTAINER_VERSION = 1
+    FLAG_ZERO_RUNS = 1
+
+    def __init__(self, lanes=256):
+        self.lanes = lanes
+        self.used_lanes = 1
+        self.prob_bits = self.MIN_PROB_BITS
+        self.frequencies = None
+        self.offset = 0
+        self.dtype = None
+        self.shape = None
+        self.zero_runs = False
+
+    def scale_frequencies(self, frequency):
+        """
+        Function that scales the histogram so that it adds up to 2^prob_bits, keeping every symbol
+        that appears at a frequency of at least 1.
+        """
+        frequency = np.asarray(frequency, dtype=np.int64)
+        used = np.count_nonzero(frequency)
+
+        # enough precision for every symbol to get a frequency of its own
+        self.prob_bits = max(self.MIN_PROB_BITS, math.ceil(math.log2(max(used, 1))))
+        if (self.prob_bits > self.MAX_PROB_BITS):
+            raise ValueError("Too many different symbols for rANS: " + str(used))
+
+        total = 1 << self.prob_bits
+        scaled = np.zeros(len(frequency), dtype=np.int64)
+        if (used == 0):
+            self.frequencies = scaled
+            return
+
+        scaled[frequency > 0] = np.maximum(1, frequency[frequency > 0] * total // frequency.sum())
+
+        # give the rounding difference to the most frequent symbols, without letting any of them reach 0
+        difference = total - scaled.sum()
+        order = np.argsort(-scaled, kind='stable')
+        i = 0
+        while (difference != 0):
+            symbol = order[i % used]
+            change = max(difference, 1 - scaled[symbol]) if difference < 0 else difference
+            scaled[symbol] += change
+            difference -= change
+            i += 1
+
+        self.frequencies = scaled
+
+    def create_tables(self):
+        """
+        Function that creates the cumulative frequencies and the table that gives the symbol of each slot.
+        """
+        self.cumulative = np.cumsum(self.frequencies) - self.frequencies
+        self.slot_symbols = np.repeat(np.arange(len(self.frequencies)), self.frequencies)
+
+    def estimate_size(self, frequency):
+        """
+        Function that estimates the size in bytes of the encoded data and its tables, from the histogram alone.
+        """
+        self.scale_frequencies(frequency)
+        used = frequency > 0
+
+        bits = np.sum(frequency[used] * (self.prob_bits - np.log2(self.frequencies[used])))
+
+        lanes = max(1, min(self.lanes, int(frequency.sum()) // self.SYMBOLS_PER_LANE))
+
+        return int(bits / 8) + 2 * len(frequency) + 4 * lanes
+
+    def encode_symbols(self, symbols):
+        """
+        Function that encodes the symbols with the current frequencies.
+        Returns the final state of each lane and the 16-bit words written, in the order the decoder reads them.
+        """
+        symbols = np.asarray(symbols, dtype=np.intp)
+        lanes = max(1, min(self.lanes, len(symbols) // self.SYMBOLS_PER_LANE))
+        self.used_lanes = lanes
+        steps = -(-len(symbols) // lanes)
+
+        frequencies = self.frequencies.astype(np.uint64)[symbols]
+        cumulative = self.cumulative.astype(np.uint64)[symbols]
+        # a lane whose state is at least this much has to write 16 bits before encoding the symbol
+        limits = (frequencies << np.uint64(32 - self.prob_bits))
+
+        states = np.full(lanes, self.STATE_LOW, dtype=np.uint64)
+        written = []
+
+        # rANS works like a stack, so the symbols are encoded from the last to the first
+        for step in range(steps - 1, -1, -1):
+            first = step * lanes
+            active = min(lanes, len(symbols) - first)
+            x = states[:active]
+            f = frequencies[first:first + active]
+
+            full = x >= limits[first:first + active]
+            written.append((x[full] & np.uint64(0xFFFF)).astype(np.uint16))
+            x = np.where(full, x >> np.uint64(16), x)
+
+            states[:active] = ((x // f) << np.uint64(self.prob_bits)) + (x % f) + cumulative[first:first + active]
+
+        words = np.concatenate(written)[::-1] if len(written) > 0 else np.zeros(0, dtype=np.uint16)
+
+        return states.astype(np.uint32), words
+
+    def decode_symbols(self, states, words, count):
+        """
+        Function that decodes `count` symbols from the final states of the lanes and the words of encode_symbols.
+        """
+        lanes = len(states)
+        steps = -(-count // lanes)
+        mask = np.uint64((1 << self.prob_bits) - 1)
+
+        frequencies = self.frequencies.astype(np.uint64)
+        cumulative = self.cumulative.astype(np.uint64)
+
+        states = states.astype(np.uint64)
+        words = words.astype(np.uint64)
+        symbols = np.empty(count, dtype=np.intp)
+        position = 0
+
+        for step in range(steps):
+            first = step * lanes
+            active = min(lanes, count - first)
+            x = states[:active]
+
+            slots = x & mask
+            decoded = self.slot_symbols[slots]
+            symbols[first:first + active] = decoded
+            x = frequencies[decoded] * (x >> np.uint64(self.prob_bits)) + slots - cumulative[decoded]
+
+            # the lanes that fell below the lower limit read back the 16 bits the encoder wrote
+            empty = np.flatnonzero(x < self.STATE_LOW)
+            if (position + len(empty) > len(words)):
+                raise ValueError("The encoded data ends unexpectedly")
+            x[empty] = (x[empty] << np.uint64(16)) | words[position:position + len(empty)][::-1]
+            position += len(empty)
+
+            states[:active] = x
+
+        if (position != len(words) or np.any(states != self.STATE_LOW)):
+            raise ValueError("The encoded data is corrupted")
+
+        return symbols
+
+    def prepare(self, array, zero_runs):
+        """
+        Function that keeps the information of the array, builds the frequencies and returns the symbols to encode.
+        """
+        array = np.asarray(array)
+        if (array.dtype.kind not in 'ui'):
+            raise ValueError("Only integer arrays can be encoded, got " + str(array.dtype))
+
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.zero_runs = zero_runs
+
+        values = encode_zero_runs(array) if zero_runs else array
+        symbols, frequency, self.offset = create_freq_array(values)
+
+        self.scale_frequencies(frequency)
+        self.create_tables()
+
+        return symbols
+
+    def restore(self, symbols):
+        """
+        Function that turns the decoded symbols back into an array with the kept shape and type.
+        """
+        values = symbols + self.offset
+        if (self.zero_runs):
+            values = decode_zero_runs(values)
+
+        return values.astype(self.dtype).reshape(self.shape)
+
+    def encode_array(self, array, zero_runs=False):
+        """
+        Encoding function for numpy arrays - returns the encoded bytes.
+        As with HuffmanCoding, the frequencies are kept in the object and decode_array needs them.
+        """
+        symbols = self.prepare(array, zero_runs)
+        self.symbol_count = len(symbols)
+
+        states, words = self.encode_symbols(symbols)
+
+        return states.tobytes() + words.tobytes()
+
+    def decode_array(self, data, shape=None):
+        """
+        Decoding function for the bytes returned by encode_array - returns the decoded numpy array.
+        """
+        if (shape is not None):
+            self.shape = shape
+
+        self.create_tables()
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        states = buffer[:4 * self.used_lanes].view(np.uint32)
+        words = buffer[4 * self.used_lanes:].view(np.uint16)
+
+        return self.restore(self.decode_symbols(states, words, self.symbol_count))
+
+    # FUNCTIONS USED FOR THE SELF-DESCRIBING CONTAINER
+
+    def encode_container(self, array, zero_runs=False):
+        """
+        Encoding function that returns the array in a container which can be decoded by any RansCoding object.
+        The header holds the shape, the type, the number of symbols and lanes, the precision and the flags,
+        followed by a CRC32 checksum, the scaled frequencies, the final states and the words.
+        """
+        symbols = self.prepare(array, zero_runs)
+        states, words = self.encode_symbols(symbols)
+
+        header = pack_array_header(self.CONTAINER_MAGIC, self.CONTAINER_VERSION, self.shape, self.dtype)
+        header += struct.pack("<qIQIBB", self.offset, len(self.frequencies), len(symbols), self.used_lanes,
+                              self.prob_bits, self.FLAG_ZERO_RUNS if zero_runs else 0)
+
+        body = self.frequencies.astype("<u2").tobytes() + states.astype("<u4").tobytes() + words.astype("<u2").tobytes()
+        checksum = zlib.crc32(header, zlib.crc32(body))
+
+        return header + struct.pack("<I", checksum) + body
+
+    def decode_container(self, data):
+        """
+        Decoding function for the bytes returned by encode_container - returns the decoded numpy array.
+        """
+        file = io.BytesIO(data)
+
+        self.shape, self.dtype, header = read_array_header(file, self.CONTAINER_MAGIC, self.CONTAINER_VERSION, "rANS")
+        fields = read_exactly(file, struct.calcsize("<qIQIBB"))
+        self.offset, alphabet_size, symbol_count, self.used_lanes, self.prob_bits, flags = struct.unpack("<qIQIBB", fields)
+        self.zero_runs = (flags & self.FLAG_ZERO_RUNS) != 0
+        header += fields
+
+        (checksum,) = struct.unpack("<I", read_exactly(file, 4))
+        body = file.read()
+        if (zlib.crc32(header, zlib.crc32(body)) != checksum):
+            raise ValueError("Checksum mismatch, the container is corrupted")
+
+        body = np.frombuffer(body, dtype=np.uint8)
+        self.frequencies = body[:2 * alphabet_size].view("<u2").astype(np.int64)
+        states = body[2 * alphabet_size:2 * alphabet_size + 4 * self.used_lanes].view("<u4")
+        words = body[2 * alphabet_size + 4 * self.used_lanes:].view("<u2")
+
+        if (self.frequencies.sum() != (1 << self.prob_bits) and symbol_count > 0):
+            raise ValueError("The frequencies of the container are invalid")
+        self.create_tables()
+
+        return self.restore(self.decode_symbols(states, words, symbol_count))
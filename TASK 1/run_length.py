@@ -0,0 +1,80 @@
+import numpy as np
+
+# symbols 0...RUN_SYMBOLS-1 stand for runs of 2^symbol zeros, the non-zero values come after them
+RUN_SYMBOLS = 48
+
+def zigzag(values):
+    """
+    Maps the signed values 0, -1, 1, -2, 2, ... to 0, 1, 2, 3, 4, ... so that they are all non-negative.
+    """
+    return np.where(values >= 0, 2 * values, -2 * values - 1)
+
+def unzigzag(values):
+    """
+    Inverse of zigzag.
+    """
+    return (values >> 1) ^ -(values & 1)
+
+def count_set_bits(values):
+    """
+    Returns the number of bits that are 1 in each (non-negative) value.
+    """
+    counts = np.zeros(len(values), dtype=np.int64)
+    for k in range(RUN_SYMBOLS):
+        counts += (values >> k) & 1
+
+    return counts
+
+def encode_zero_runs(values):
+    """
+    Function that replaces the runs of zeros of an integer array with run symbols.
+    A run of n zeros becomes one symbol for each power of two in n (e.g. 13 = 8 + 4 + 1 gives three symbols),
+    so any run length can be written with only RUN_SYMBOLS different symbols. The non-zero values are mapped
+    after the run symbols. Returns a 1d array of non-negative symbols.
+    """
+    values = np.asarray(values).ravel().astype(np.int64)
+    is_zero = values == 0
+
+    # find where each run of zeros starts and ends
+    padded = np.concatenate(([False], is_zero, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    run_starts, run_lengths = changes[0::2], changes[1::2] - changes[0::2]
+
+    if (len(run_lengths) > 0 and run_lengths.max() >= 1 << RUN_SYMBOLS):
+        raise ValueError("Runs of zeros longer than 2^" + str(RUN_SYMBOLS) + " can not be encoded")
+
+    # every non-zero value gives one symbol and every run as many symbols as the bits of its length
+    sizes = (~is_zero).astype(np.int64)
+    sizes[run_starts] = count_set_bits(run_lengths)
+    positions = np.cumsum(sizes) - sizes
+
+    symbols = np.empty(int(sizes.sum()), dtype=np.int64)
+
+    nonzero = np.flatnonzero(~is_zero)
+    # zigzag of a non-zero value is at least 1
+    symbols[positions[nonzero]] = zigzag(values[nonzero]) + RUN_SYMBOLS - 1
+
+    # write the symbols of each run one after the other, starting from the smallest power
+    run_positions = positions[run_starts]
+    for k in range(RUN_SYMBOLS):
+        has_bit = ((run_lengths >> k) & 1) == 1
+        symbols[run_positions[has_bit]] = k
+        run_positions[has_bit] += 1
+
+    return symbols
+
+def decode_zero_runs(symbols):
+    """
+    Function that expands the symbols created by encode_zero_runs back to the original values.
+    """
+    symbols = np.asarray(symbols, dtype=np.int64)
+    is_run = symbols < RUN_SYMBOLS
+
+    values = unzigzag(symbols - (RUN_SYMBOLS - 1))
+    values[is_run] = 0
+
+    # a run symbol stands for 2^symbol zeros, any other symbol for a single value
+    counts = np.ones(len(symbols), dtype=np.int64)
+    counts[is_run] = np.left_shift(1, symbols[is_run])
+
+    return np.repeat(values, counts)
@@ -1,21 +1,17 @@
 import cv2
-import numpy as np 
 import os
 import math
-from glob import glob
-from natsort import natsorted
 
-def cut_frames():
+def cut_frames(path='car_moving.mp4', frames_skipped=10, folder='frames'):
     """
-    Function that cuts the video given into frames
+    Function that cuts the video given into frames, saving 1 out of frames_skipped frames in the folder
     """
-    frames_skipped = 10     # save 1 out of 10 frames
-    cap = cv2.VideoCapture('car_moving.mp4')
+    cap = cv2.VideoCapture(path)
 
     # check if a folder to save the frames exists - if not, create it
     try:
-        if not os.path.exists('frames'):
-            os.makedirs('frames')
+        if not os.path.exists(folder):
+            os.makedirs(folder)
     except OSError:
         print("Error creating folder!")
         
@@ -26,9 +22,9 @@ def cut_frames():
         
         ret, frame = cap.read()     # capture frame-by-frame
                 
-        name = 'frames/frame' + str(math.trunc(currentFrame/10)) + '.jpg'
+        name = os.path.join(folder, 'frame' + str(math.trunc(currentFrame/frames_skipped)) + '.jpg')
 
-        # save only 1 out of 10 frames
+        # save only 1 out of frames_skipped frames
         if (currentFrame // frames_skipped == currentFrame / frames_skipped):
             print('Creating...' + name)
             cv2.imwrite(name, frame)
@@ -1,5 +1,3 @@
-from re import search
-from typing import final
 import numpy as np
 from natsort import natsorted
 from glob import glob
@@ -7,53 +5,25 @@ import cv2
 import os
 import math
 
-# filenames contains the path for every frame in the frames folder
-filenames = [frame for frame in glob("frames/*.jpg")]
-sorted = natsorted(filenames)
-# store the frames
-frames = []
-for frame in sorted:
-    temp = cv2.imread(frame, cv2.IMREAD_GRAYSCALE)    # read the frames as grayscale
-    frames.append(temp)
-# convert to numpy array
-frames = np.array(frames)
-
-# car_frames contains the path for every frame in the specific_area folder
-car_frames = [frame for frame in glob("frames/specific_area/*.jpg")]
-sorted = natsorted(car_frames)
-# store the frames
-car_frames = []
-for frame in sorted:
-    temp = cv2.imread(frame, cv2.IMREAD_GRAYSCALE)    # read the frames as grayscale
-    car_frames.append(temp)
-# convert to numpy array
-car_frames = np.array(car_frames)
-
-# no_car contains the path for every frame in the no_car folder
-no_car = [frame for frame in glob("frames/no_car/*.jpg")]
-sorted = natsorted(no_car)
-# store the frames
-no_car = []
-for frame in sorted:
-    temp = cv2.imread(frame, cv2.IMREAD_GRAYSCALE)    # read the frames as grayscale
-    no_car.append(temp)
-# convert to numpy array
-no_car = np.array(no_car)
-
-def get_car():
+def get_car(frames, folder='frames/specific_area'):
     """
     Function that cuts the region the car exists in the original video. 
     In this way it's simpler to remove the car from the video as the background seems to be the same in all frames.
+    The regions are saved in the folder and returned.
     """
     try:
-        if not os.path.exists('frames/specific_area'):
-            os.makedirs('frames/specific_area')
+        if not os.path.exists(folder):
+            os.makedirs(folder)
     except OSError:
         print("Error creating folder!")
 
+    car_frames = []
     for i in range(len(frames)):
         wanted_area = frames[i][272:448, 512:656]
-        cv2.imwrite("frames/specific_area/car" + str(i) + ".jpg", wanted_area)
+        cv2.imwrite(os.path.join(folder, "car" + str(i) + ".jpg"), wanted_area)
+        car_frames.append(wanted_area)
+
+    return np.array(car_frames)
 
 def divide_frame(frame):
     """
@@ -207,24 +177,28 @@ def remove_car_helper(frame, target_frame):
     
     return new_frame
 
-def remove_car():
+def remove_car(frames, car_frames, folder='frames/no_car'):
     """
     Function which removes the car from the frames that contain the specific area the car exists.
+    The frames without the car are saved in the folder and returned, one for every frame after the first.
     """
     try:
-        if not os.path.exists('frames/no_car'):
-            os.makedirs('frames/no_car')
+        if not os.path.exists(folder):
+            os.makedirs(folder)
     except OSError:
         print("Error creating folder!")
 
     new_frame = remove_car_helper(car_frames[0], car_frames[1])
 
-    for i in range(len(car_frames) + 1):
+    no_car = []
+    for i in range(len(car_frames) - 1):
         removed_car = new_frame
-        next_frame = car_frames[i + 1]
         new_frame = remove_car_helper(removed_car, frames[i + 1])
 
-        cv2.imwrite("frames/no_car/no_car" + str(i) + ".jpg", new_frame)
+        cv2.imwrite(os.path.join(folder, "no_car" + str(i) + ".jpg"), new_frame)
+        no_car.append(new_frame.copy())
+
+    return np.array(no_car)
 
 def final_removement(no_car, frame):
     """
@@ -234,27 +208,32 @@ def final_removement(no_car, frame):
     
     return frame
 
-def frames_to_video():
+def frames_to_video(folder='frames/final', filename='no-car.mp4', fps=1):
     """
-    Function that creates a video using the frames created that no longer contain the car.
+    Function that creates a video using the frames created that no longer contain the car,
+    with the size of the first frame.
     """
-    fps = 1
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    filename = "no-car.mp4"
-    video_writer = cv2.VideoWriter(filename, fourcc, fps, (1280, 720))
-    for i in range(0, 18):
-        if os.path.exists("frames/final/final" + str(i) + ".jpg"):
-            img = cv2.imread(filename = "frames/final/final" + str(i) + ".jpg")
-            cv2.waitKey(100)
-            video_writer.write(img)
-            print(str(i) + ".jpg done")
-    video_writer.release()
+    video_writer = None
+    for name in natsorted(glob(os.path.join(folder, "final*.jpg"))):
+        img = cv2.imread(name)
+        if video_writer is None:
+            height, width = img.shape[:2]
+            video_writer = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+        video_writer.write(img)
+        print(os.path.basename(name) + " done")
+
+    if video_writer is not None:
+        video_writer.release()
 
 if __name__ == "__main__":
 
-    # get_car() 
-       
-    # remove_car()
+    # the frames are read with load_frames of TASK 1/frame_store.py, as `python cli.py remove-object` does
+    # frames = load_frames('frames')
+
+    # car_frames = get_car(frames)
+
+    # no_car = remove_car(frames, car_frames)
 
     # try:
     #     if not os.path.exists('frames/final/'):
@@ -262,7 +241,7 @@ if __name__ == "__main__":
     # except OSError:
     #     print("Error creating folder!")
 
-    # for i in range(len(frames)):
+    # for i in range(len(no_car)):
     #     final = final_removement(no_car[i], frames[i+1])
     #     cv2.imwrite("frames/final/final" + str(i) + ".jpg", final)
 